@@ -1,34 +1,1010 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Match
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, WaitQueueTimeoutError
+from bson import ObjectId
+from bson.errors import InvalidId
 import os
+import sys
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Dict, Any, AsyncIterator
 import uuid
-from datetime import datetime, timedelta
+import base64
+import time
+import csv
+import io
+import json
+import re
+import math
+import heapq
+import hashlib
+import gzip
+import bisect
+import random
+import hmac
+import secrets
+import threading
+import contextvars
+import itertools
+import cProfile
+import pstats
+import functools
+import importlib.util
+import multiprocessing
+from urllib.parse import parse_qsl
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict, defaultdict, deque
 import jwt
 import bcrypt
+import orjson
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
 from enum import Enum
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics
+# Request and Mongo command metrics in the Prometheus text format, served at
+# /metrics. Mongo commands are labelled with the route that issued them and
+# counted per request, so a handler issuing one query per row stands out.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+HTTP_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COMMANDS_PER_REQUEST_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+UNMATCHED_ROUTE = "unmatched"
+BACKGROUND_ROUTE = "background"
+
+class Histogram:
+    """Observation counts per upper bound, plus an implicit +Inf bucket"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class RequestScope:
+    """The route a request matched and the Mongo commands it has issued.
+    Profiled requests also collect the time their password hashes took."""
+    __slots__ = ("route", "commands", "mongo_seconds", "profiling", "hash_seconds")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.commands = 0
+        self.mongo_seconds = 0.0
+        self.profiling = False
+        self.hash_seconds = 0.0
+
+# Motor runs driver calls on a thread pool with a copy of the caller's
+# context, so command listeners see the request that issued the command
+current_request: "contextvars.ContextVar[Optional[RequestScope]]" = contextvars.ContextVar("current_request", default=None)
+
+def _label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values) -> str:
+    return ",".join(f'{name}="{_label_value(value)}"' for name, value in zip(names, values))
+
+class MetricsRegistry:
+    """Process-wide counters and histograms. Command listeners update it from
+    driver threads, so every access holds the lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.http_requests: Dict[tuple, int] = defaultdict(int)  # (method, route, status)
+        self.http_in_flight: Dict[tuple, int] = defaultdict(int)  # (method, route)
+        self.http_latency: Dict[tuple, Histogram] = {}  # (method, route)
+        self.request_commands: Dict[tuple, Histogram] = {}  # (method, route)
+        self.mongo_commands: Dict[tuple, int] = defaultdict(int)  # (route, collection, command)
+        self.mongo_seconds: Dict[tuple, float] = defaultdict(float)  # (route, collection, command)
+        self.mongo_failures: Dict[tuple, int] = defaultdict(int)  # (route, collection, command)
+        self.mongo_latency: Dict[tuple, Histogram] = {}  # (collection, command)
+
+    @staticmethod
+    def _histogram(histograms: Dict[tuple, Histogram], key: tuple, buckets) -> Histogram:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(buckets)
+        return histogram
+
+    def request_started(self, method: str, route: str) -> None:
+        with self._lock:
+            self.http_in_flight[(method, route)] += 1
+
+    def request_finished(self, method: str, route: str, status_code: int, seconds: float, request: RequestScope) -> None:
+        with self._lock:
+            self.http_in_flight[(method, route)] -= 1
+            self.http_requests[(method, route, str(status_code))] += 1
+            self._histogram(self.http_latency, (method, route), HTTP_LATENCY_BUCKETS).observe(seconds)
+            self._histogram(self.request_commands, (method, route), COMMANDS_PER_REQUEST_BUCKETS).observe(request.commands)
+
+    def command_finished(self, request: Optional[RequestScope], collection: str, command: str, seconds: float, failed: bool) -> None:
+        key = (request.route if request else BACKGROUND_ROUTE, collection, command)
+        with self._lock:
+            if request is not None:
+                request.commands += 1
+                request.mongo_seconds += seconds
+            self.mongo_commands[key] += 1
+            self.mongo_seconds[key] += seconds
+            if failed:
+                self.mongo_failures[key] += 1
+            self._histogram(self.mongo_latency, (collection, command), MONGO_LATENCY_BUCKETS).observe(seconds)
+
+    def render(self) -> str:
+        """The Prometheus text exposition format, version 0.0.4"""
+        lines: List[str] = []
+
+        def scalar(name, kind, help_text, label_names, values):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(values.items()):
+                lines.append(f"{name}{{{_format_labels(label_names, key)}}} {value}")
+
+        def histogram(name, help_text, label_names, histograms):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in sorted(histograms.items()):
+                labels = _format_labels(label_names, key)
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        with self._lock:
+            scalar("http_requests_total", "counter", "HTTP requests by route and status code.",
+                   ("method", "route", "status"), self.http_requests)
+            scalar("http_requests_in_flight", "gauge", "HTTP requests currently being served.",
+                   ("method", "route"), self.http_in_flight)
+            histogram("http_request_duration_seconds", "Time to serve a request, body included.",
+                      ("method", "route"), self.http_latency)
+            histogram("http_request_mongo_commands", "Mongo commands issued while serving one request.",
+                      ("method", "route"), self.request_commands)
+            scalar("mongodb_commands_total", "counter", "Mongo commands by issuing route, collection and command.",
+                   ("route", "collection", "command"), self.mongo_commands)
+            scalar("mongodb_command_seconds_total", "counter", "Time spent in Mongo commands by issuing route, collection and command.",
+                   ("route", "collection", "command"), self.mongo_seconds)
+            scalar("mongodb_command_failures_total", "counter", "Mongo commands that returned an error.",
+                   ("route", "collection", "command"), self.mongo_failures)
+            histogram("mongodb_command_duration_seconds", "Mongo command round-trip time.",
+                      ("collection", "command"), self.mongo_latency)
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+def command_collection(command_name: str, command: Dict[str, Any]) -> str:
+    # Collection commands name their collection as the command's value;
+    # getMore names it separately, and server commands such as ping have none
+    if command_name == "getMore":
+        return str(command.get("collection", "-"))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else "-"
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every Mongo command and attributes it to the request that issued it"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self._pending: Dict[tuple, tuple] = {}
+
+    def started(self, event) -> None:
+        self._pending[(event.connection_id, event.request_id)] = (
+            command_collection(event.command_name, event.command), current_request.get()
+        )
+
+    def succeeded(self, event) -> None:
+        self._finish(event, failed=False)
+
+    def failed(self, event) -> None:
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool) -> None:
+        collection, request = self._pending.pop((event.connection_id, event.request_id), ("-", None))
+        self.registry.command_finished(request, collection, event.command_name, event.duration_micros / 1e6, failed)
+
+def route_template(scope) -> str:
+    """The path template of the route a request will be dispatched to, which
+    keeps label values bounded whatever ids appear in the URL"""
+    fallback = UNMATCHED_ROUTE
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and fallback == UNMATCHED_ROUTE:
+            fallback = route.path
+    return fallback
+
+class MetricsMiddleware:
+    """Records latency, status and in-flight count per route, and scopes Mongo
+    command metrics to the request"""
+
+    def __init__(self, app, registry: MetricsRegistry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        request = RequestScope(route_template(scope))
+        token = current_request.set(request)
+        status_code = 500  # unless a response starts before an error escapes
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.registry.request_started(method, request.route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.registry.request_finished(method, request.route, status_code, time.perf_counter() - started, request)
+            current_request.reset(token)
+
+# Slow query log
+# Commands slower than the threshold are kept in a bounded in-memory log with
+# their filter shape (values redacted) and issuing route. A background task
+# explains them with executionStats, at most once per shape per interval.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 200))
+SLOW_QUERY_EXPLAIN_SECONDS = float(os.environ.get('SLOW_QUERY_EXPLAIN_SECONDS', 60))
+SLOW_QUERY_EXPLAIN_QUEUE = 50
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+# Session, transaction and routing fields the driver adds; explain rejects them
+DRIVER_COMMAND_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "writeConcern", "readConcern"}
+
+def query_shape(value: Any) -> Any:
+    """``value`` with every literal replaced by "?"; keys, operators and
+    ``$field`` references are kept"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ["?"]
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+    return "?"
+
+def command_shape(command: Dict[str, Any]) -> Dict[str, Any]:
+    shape: Dict[str, Any] = {}
+    for field in ("filter", "query", "pipeline"):
+        if field in command:
+            shape[field] = query_shape(command[field])
+    statements = command.get("updates") or command.get("deletes")
+    if statements:
+        shape["filter"] = query_shape(statements[0].get("q", {}))
+        if len(statements) > 1:
+            shape["statements"] = len(statements)
+    if "sort" in command:
+        shape["sort"] = dict(command["sort"])
+    if "key" in command:
+        shape["key"] = command["key"]
+    return shape
+
+def explain_target(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    """The command to explain; updates and deletes are explained one statement at a time"""
+    target = {
+        key: value for key, value in command.items()
+        if not key.startswith("$") and key not in DRIVER_COMMAND_FIELDS
+    }
+    for field in ("updates", "deletes"):
+        if field in target:
+            target[field] = target[field][:1]
+    return target
+
+def _plan_indexes(plan: Dict[str, Any]) -> List[str]:
+    names = [plan["indexName"]] if "indexName" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            names.extend(_plan_indexes(plan[key]))
+    for child in plan.get("inputStages", []):
+        names.extend(_plan_indexes(child))
+    return names
+
+def explain_summary(explain: Dict[str, Any]) -> Dict[str, Any]:
+    # Aggregations that are not pushed down wholly report their query under a $cursor stage
+    stages = explain.get("stages")
+    if stages and "$cursor" in stages[0]:
+        explain = stages[0]["$cursor"]
+    winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+    plan_stages = _plan_stages(winning)
+    execution = explain.get("executionStats", {})
+    return {
+        "stages": plan_stages,
+        "collection_scan": "COLLSCAN" in plan_stages,
+        "index_scan": "IXSCAN" in plan_stages,
+        "indexes": _plan_indexes(winning),
+        "docs_examined": execution.get("totalDocsExamined"),
+        "keys_examined": execution.get("totalKeysExamined"),
+        "returned": execution.get("nReturned"),
+        "execution_ms": execution.get("executionTimeMillis"),
+    }
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Records slow commands as the driver reports them.
+
+    Listener callbacks run on driver threads and must not block, so explains
+    are handed to the event loop and run by ``explain_pending``. Entries
+    whose explain could not be queued keep ``explain`` as None.
+    """
+
+    def __init__(self, threshold_ms: float, size: int, explain_seconds: float):
+        self.threshold_micros = threshold_ms * 1000
+        self.threshold_ms = threshold_ms
+        self.entries: deque = deque(maxlen=size)
+        self.explain_seconds = explain_seconds
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: Dict[tuple, tuple] = {}
+        self._explained: "OrderedDict[str, tuple]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+
+    def started(self, event) -> None:
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            self._pending[(event.connection_id, event.request_id)] = (
+                event.command, event.database_name, current_request.get()
+            )
+
+    def succeeded(self, event) -> None:
+        self._finish(event)
+
+    def failed(self, event) -> None:
+        self._finish(event)
+
+    def _finish(self, event) -> None:
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None or event.duration_micros < self.threshold_micros:
+            return
+        command, database, request = pending
+        entry = {
+            "id": next(self._ids),
+            "at": datetime.utcnow(),
+            "route": request.route if request else BACKGROUND_ROUTE,
+            "database": database,
+            "collection": command_collection(event.command_name, command),
+            "command": event.command_name,
+            "duration_ms": round(event.duration_micros / 1000, 3),
+            "shape": command_shape(command),
+            "explain": None,
+        }
+        with self._lock:
+            self.recorded += 1
+            self.entries.append(entry)
+        if self._loop is not None:
+            target = explain_target(event.command_name, command)
+            try:
+                self._loop.call_soon_threadsafe(self._enqueue, entry, target)
+            except RuntimeError:  # loop closed during shutdown
+                pass
+
+    def _enqueue(self, entry: Dict[str, Any], target: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait((entry, target))
+        except asyncio.QueueFull:
+            pass
+
+    async def explain_pending(self) -> None:
+        """Explain queued slow commands, one at a time, until cancelled"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=SLOW_QUERY_EXPLAIN_QUEUE)
+        try:
+            while True:
+                entry, target = await self._queue.get()
+                key = orjson.dumps([entry["database"], entry["collection"], entry["command"], entry["shape"]]).decode()
+                explained = self._explained.get(key)
+                if explained and time.monotonic() - explained[0] < self.explain_seconds:
+                    entry["explain"] = explained[1]
+                    continue
+                try:
+                    explain = await client[entry["database"]].command(
+                        "explain", target, verbosity="executionStats"
+                    )
+                    summary = explain_summary(explain)
+                except Exception as exc:  # the log must not take the worker down
+                    summary = {"error": str(exc)}
+                entry["explain"] = summary
+                self._explained[key] = (time.monotonic(), summary)
+                self._explained.move_to_end(key)
+                while len(self._explained) > self.entries.maxlen:
+                    self._explained.popitem(last=False)
+        finally:
+            self._loop = None
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Entries newest first"""
+        with self._lock:
+            return list(reversed(self.entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.recorded = 0
+
+slow_queries = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_EXPLAIN_SECONDS)
+
 # MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# The client is configured here but connects lazily: the app's lifespan opens
+# and warms the pool before the first request and closes it on shutdown.
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 10))
+MONGO_MAX_IDLE_MS = int(os.environ.get('MONGO_MAX_IDLE_MS', 300000))
+# How long a request waits for a free connection before it gets a 503
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+# 0 leaves socket reads unbounded, which exports and rollup rebuilds rely on
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 0))
+# Wire compression in order of preference; codecs whose library is missing are skipped
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zstd,snappy,zlib')
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+# Index keys read per index at startup to pull index pages into the cache
+MONGO_WARMUP_INDEX_KEYS = int(os.environ.get('MONGO_WARMUP_INDEX_KEYS', 1000))
+# /health reports "degraded" from this share of the pool in use, or when a
+# checkout timed out waiting for a connection within the window
+POOL_SATURATION_WARNING = 0.9
+POOL_TIMEOUT_WINDOW_SECONDS = 60
+HEALTH_PING_SECONDS = 2.0
+
+def available_compressors(names: str) -> List[str]:
+    return [
+        name for name in (n.strip() for n in names.split(","))
+        if name in COMPRESSOR_MODULES and importlib.util.find_spec(COMPRESSOR_MODULES[name]) is not None
+    ]
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool occupancy from the driver's pool events, summed over
+    the pools of every server the client talks to"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        # Checkouts started and not yet served; most are served at once, so
+        # this is not a queue length
+        self.checkouts_in_progress = 0
+        self.peak_in_use = 0
+        self.peak_checkouts_in_progress = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_queue_timeouts = 0
+        self.last_wait_queue_timeout: Optional[float] = None
+        self.cleared = 0
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.cleared += 1
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event) -> None:
+        with self._lock:
+            self.checkouts_in_progress += 1
+            self.peak_checkouts_in_progress = max(self.peak_checkouts_in_progress, self.checkouts_in_progress)
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self.checkouts_in_progress -= 1
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.wait_queue_timeouts += 1
+                self.last_wait_queue_timeout = time.monotonic()
+
+    def connection_checked_out(self, event) -> None:
+        with self._lock:
+            self.checkouts_in_progress -= 1
+            self.in_use += 1
+            self.checkouts += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self, max_pool_size: int) -> Dict[str, Any]:
+        with self._lock:
+            last_timeout = self.last_wait_queue_timeout
+            return {
+                "open": self.open,
+                "in_use": self.in_use,
+                "checkouts_in_progress": self.checkouts_in_progress,
+                "saturation": round(self.in_use / max_pool_size, 3),
+                "peak_in_use": self.peak_in_use,
+                "peak_checkouts_in_progress": self.peak_checkouts_in_progress,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_queue_timeouts": self.wait_queue_timeouts,
+                "seconds_since_wait_queue_timeout": (
+                    round(time.monotonic() - last_timeout, 1) if last_timeout is not None else None
+                ),
+                "cleared": self.cleared,
+            }
+
+class MongoConnection:
+    """The Motor client with its pool settings, warmup and pool statistics"""
+
+    def __init__(self, url: str, db_name: str, listeners: List[Any]):
+        self.pool = PoolMonitor()
+        self.options = {
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": MONGO_MAX_IDLE_MS,
+            "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS or None,
+        }
+        compressors = available_compressors(MONGO_COMPRESSORS)
+        if compressors:
+            self.options["compressors"] = ",".join(compressors)
+        self.client = AsyncIOMotorClient(url, connect=False, event_listeners=[*listeners, self.pool], **self.options)
+        self.db = self.client[db_name]
+
+    async def ping(self) -> float:
+        started = time.perf_counter()
+        await self.client.admin.command("ping")
+        return round((time.perf_counter() - started) * 1000, 3)
+
+    async def connect(self) -> float:
+        """Reach the server and open the minimum pool before any request
+        needs a connection; concurrent pings each check one out"""
+        ping_ms = await self.ping()
+        await asyncio.gather(*(self.ping() for _ in range(self.options["minPoolSize"])))
+        return ping_ms
+
+    async def warm_indexes(self, indexes: Dict[str, List[IndexModel]], query_shapes, keys: int) -> None:
+        """Read the first keys of every index and run each known query shape
+        once, so index pages are cached and query plans chosen ahead of traffic"""
+        async def scan(collection_name: str, index: IndexModel):
+            spec = index.document
+            fields = {**dict.fromkeys(spec["key"], 1), "_id": 0}
+            await self.db[collection_name].find({}, fields).hint(spec["name"]).limit(keys).to_list(None)
+
+        results = await asyncio.gather(
+            *(scan(name, index) for name, models in indexes.items() for index in models),
+            *(self.db[name].find_one(query, {"_id": 1}) for name, query in query_shapes),
+            return_exceptions=True,
+        )
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures:
+            logger.warning("Index warmup: %d of %d reads failed, first: %s", len(failures), len(results), failures[0])
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {
+            "max_pool_size": self.options["maxPoolSize"],
+            "min_pool_size": self.options["minPoolSize"],
+            **self.pool.stats(self.options["maxPoolSize"]),
+        }
+
+    def close(self) -> None:
+        self.client.close()
+
+mongo = MongoConnection(
+    os.environ['MONGO_URL'], os.environ['DB_NAME'], [MongoCommandMetrics(metrics), slow_queries]
+)
+client = mongo.client
+db = mongo.db
 
 # JWT settings
 JWT_SECRET = "university_management_secret_key_2025"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+# Event streams authenticate with a single-use token in the query string
+# instead of the long-lived JWT, which would end up in access logs
+STREAM_TOKEN_SECONDS = 60
 
-# Create the main app without a prefix
-app = FastAPI(title="University Management System")
+# Password hashing settings. bcrypt releases the GIL, so a thread pool sized
+# to the cores runs hashes in parallel without blocking the event loop.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+HASH_POOL_SIZE = int(os.environ.get('HASH_POOL_SIZE', os.cpu_count() or 2))
+HASH_QUEUE_LIMIT = int(os.environ.get('HASH_QUEUE_LIMIT', 256))
+
+# Principal cache settings. Entries are dropped on update/delete; the TTL
+# bounds staleness for changes made by other workers.
+PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', 10000))
+PRINCIPAL_CACHE_TTL = float(os.environ.get('PRINCIPAL_CACHE_TTL', 30))
+
+# Dashboard counters are recounted from the source collections this often
+STATS_RECONCILE_SECONDS = float(os.environ.get('STATS_RECONCILE_SECONDS', 900))
+
+# Transcript settings: marks are reported on a /20 scale and a course is
+# passed, earning its credits, at PASS_MARK
+GRADE_SCALE = 20
+PASS_MARK = 10
+# Grade statistics histogram: equal-width bins over the /20 scale
+HISTOGRAM_BINS = 10
+
+# Pagination settings. The default matches the old fixed page so existing
+# clients see the same first page; the next page is advertised in a header.
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Export settings
+EXPORT_BATCH_SIZE = 500
+
+# Bulk ingestion settings
+MAX_BULK_ROWS = int(os.environ.get('MAX_BULK_ROWS', 10000))
+# User imports hash passwords on a process pool using every core
+IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', os.cpu_count() or 2))
+IMPORT_HASH_CHUNK = 100
+# Import job progress is kept in Mongo so any worker can answer a poll
+IMPORT_JOB_RETENTION_SECONDS = int(os.environ.get('IMPORT_JOB_RETENTION_SECONDS', 7 * 24 * 3600))
+
+# Timetable generation settings
+DEFAULT_TIMETABLE_SECONDS = 10.0
+MAX_TIMETABLE_SECONDS = float(os.environ.get('MAX_TIMETABLE_SECONDS', 120))
+
+# Exams longer than this are rejected; it bounds clash-check range scans
+MAX_EXAM_MINUTES = 8 * 60
+
+# Conditional GET settings: how often each worker picks up version bumps
+# made by other workers
+VERSION_POLL_SECONDS = float(os.environ.get('VERSION_POLL_SECONDS', 1))
+
+# Event stream settings
+EVENT_QUEUE_SIZE = 100
+MAX_EVENT_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', 1000))
+EVENT_KEEPALIVE_SECONDS = 15
+EVENT_RETRY_MS = 5000
+
+# Compression settings, preferred coding first
+CONTENT_CODINGS = ("br", "gzip") if brotli else ("gzip",)
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+# Search settings
+MAX_SEARCH_PREFIX = 16
+# Internal fields that never leave the API
+HIDDEN_FIELDS = {"search_keys": 0, "search_ranks": 0, "clash_keys": 0}
+
+# JSON responses are encoded by orjson
+def _json_default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson-rendered JSON. Returning it directly also skips FastAPI's
+    ``jsonable_encoder`` walk over the content."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+# Response compression
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+def accepted_codings(accept_encoding: str) -> set:
+    codings = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        codings.add(coding.strip().lower())
+    return codings
+
+class CompressionMiddleware:
+    """Compress large single-part responses with brotli or gzip.
+
+    Streaming responses (exports, event streams) pass through untouched. A
+    strong ETag gets the coding appended, because the compressed bytes are a
+    different representation of the resource.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        offered = accepted_codings(request_headers.get("accept-encoding", ""))
+        coding = next((c for c in CONTENT_CODINGS if c in offered), None)
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            if (
+                message.get("more_body")
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            if coding == "br":
+                body = brotli.compress(body, quality=BROTLI_QUALITY)
+            else:
+                body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers["Content-Encoding"] = coding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f'{etag[:-1]}-{coding}"'
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+# Request profiling
+# An admin can have a single request profiled by sending ``X-Profile`` or a
+# ``profile`` query parameter: "pstats" runs it under cProfile, "collapsed"
+# samples the event loop's stacks into flame graph input. The response is
+# replaced by the profile and a breakdown of where the time went. Both
+# profilers see the whole event loop thread, so concurrent requests show up
+# too. Requests without the flag only pay for the header check.
+PROFILE_HEADER = b"x-profile"
+PROFILE_FORMATS = ("pstats", "collapsed")
+PROFILE_SAMPLE_SECONDS = 0.001
+PROFILE_TOP_FUNCTIONS = 40
+# Time broken out in the breakdown, matched against code paths and names
+PROFILE_GROUPS = {
+    "pydantic": ("pydantic",),
+    "convert_objectid_to_str": ("convert_objectid_to_str",),
+    "json_encoding": ("orjson", "FastJSONResponse.render", "jsonable_encoder"),
+}
+
+def requested_profile(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return value.decode("latin-1").strip().lower() or PROFILE_FORMATS[0]
+    query = scope.get("query_string", b"")
+    if b"profile=" in query:
+        for key, value in parse_qsl(query.decode("latin-1"), keep_blank_values=True):
+            if key == "profile":
+                return value.strip().lower() or PROFILE_FORMATS[0]
+    return None
+
+def _frame_label(code) -> str:
+    path = "/".join(Path(code.co_filename).parts[-2:])
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({path}:{code.co_firstlineno})"
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Dict[str, int] = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+    def group_seconds(self, wall: float) -> Dict[str, float]:
+        total = sum(self.samples.values())
+        groups = {}
+        for group, patterns in PROFILE_GROUPS.items():
+            hits = sum(
+                count for stack, count in self.samples.items()
+                if any(pattern in stack for pattern in patterns)
+            )
+            groups[group] = wall * hits / total if total else 0.0
+        return groups
+
+def profile_group_seconds(stats: pstats.Stats) -> Dict[str, float]:
+    """Cumulative time per group from cProfile stats, counting only calls
+    made from outside the group so nested members are not counted twice"""
+    labels = {func: f"{func[0]}:{func[2]}" for func in stats.stats}
+    groups = {}
+    for group, patterns in PROFILE_GROUPS.items():
+        members = {func for func, label in labels.items() if any(pattern in label for pattern in patterns)}
+        seconds = 0.0
+        for func in members:
+            _, _, _, cumulative, callers = stats.stats[func]
+            if not callers:
+                seconds += cumulative
+            seconds += sum(edge[3] for caller, edge in callers.items() if caller not in members)
+        groups[group] = seconds
+    return groups
+
+class ProfilingMiddleware:
+    """Profiles requests that ask for it, for admins only, one at a time"""
+
+    def __init__(self, app):
+        self.app = app
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile_format = requested_profile(scope)
+        if profile_format is None:
+            await self.app(scope, receive, send)
+            return
+        error = await self._check(scope, profile_format)
+        if error is not None:
+            await error(scope, receive, send)
+            return
+        self._active = True
+        try:
+            await self._profile(scope, receive, send, profile_format)
+        finally:
+            self._active = False
+
+    async def _check(self, scope, profile_format: str) -> Optional[Response]:
+        if profile_format not in PROFILE_FORMATS:
+            return FastJSONResponse(
+                {"detail": f"Unknown profile format; use one of {', '.join(PROFILE_FORMATS)}"},
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
+        scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+        try:
+            if scheme.lower() != "bearer" or not token:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+            user = await authenticate(token)
+        except HTTPException as exc:
+            return FastJSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+        if user["role"] != UserRole.ADMIN:
+            return FastJSONResponse(
+                {"detail": "Profiling is limited to administrators"},
+                status_code=status.HTTP_403_FORBIDDEN,
+            )
+        if self._active:
+            return FastJSONResponse(
+                {"detail": "Another request is being profiled"},
+                status_code=status.HTTP_409_CONFLICT,
+            )
+        return None
+
+    async def _profile(self, scope, receive, send, profile_format: str) -> None:
+        request = current_request.get()
+        token = None
+        if request is None:
+            request = RequestScope(route_template(scope))
+            token = current_request.set(request)
+        request.profiling = True
+        commands, mongo_seconds = request.commands, request.mongo_seconds
+        result = {"status": 500, "response_bytes": 0}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                result["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                result["response_bytes"] += len(message.get("body", b""))
+
+        cpu_started = time.thread_time()
+        started = time.perf_counter()
+        try:
+            if profile_format == "pstats":
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    await self.app(scope, receive, capture)
+                finally:
+                    profiler.disable()
+                wall, cpu = time.perf_counter() - started, time.thread_time() - cpu_started
+                output = io.StringIO()
+                stats = pstats.Stats(profiler, stream=output)
+                groups = profile_group_seconds(stats)
+                stats.strip_dirs().sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+                profile = output.getvalue()
+            else:
+                sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_SECONDS)
+                sampler.start()
+                try:
+                    await self.app(scope, receive, capture)
+                finally:
+                    sampler.stop()
+                wall, cpu = time.perf_counter() - started, time.thread_time() - cpu_started
+                groups = sampler.group_seconds(wall)
+                profile = sampler.collapsed()
+        finally:
+            request.profiling = False
+            if token is not None:
+                current_request.reset(token)
+
+        breakdown = {
+            "wall_ms": round(wall * 1000, 3),
+            "event_loop_cpu_ms": round(cpu * 1000, 3),
+            "mongo_commands": request.commands - commands,
+            "mongo_ms": round((request.mongo_seconds - mongo_seconds) * 1000, 3),
+            "bcrypt_ms": round(request.hash_seconds * 1000, 3),
+            **{f"{group}_ms": round(seconds * 1000, 3) for group, seconds in groups.items()},
+        }
+        response = FastJSONResponse({
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": request.route,
+            "status": result["status"],
+            "response_bytes": result["response_bytes"],
+            "format": profile_format,
+            "breakdown": breakdown,
+            "profile": profile,
+        })
+        await response(scope, receive, send)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -152,77 +1128,1759 @@ class ScheduleCreate(BaseModel):
     end_time: str
     classroom: str
 
-class Grade(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    student_id: str
-    course_id: str
-    exam_type: ExamType
-    score: float
-    max_score: float
-    exam_date: datetime
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+class TimeSlot(BaseModel):
+    start_time: str
+    end_time: str
+
+class TimetableRequest(BaseModel):
+    year: int
+    semester: str
+    classrooms: List[str] = Field(..., min_length=1)
+    days: List[str] = Field(..., min_length=1)
+    slots: List[TimeSlot] = Field(..., min_length=1)
+    sessions_per_course: int = Field(1, ge=1, le=10)
+    time_budget_seconds: float = Field(DEFAULT_TIMETABLE_SECONDS, gt=0, le=MAX_TIMETABLE_SECONDS)
+    seed: int = 0
+    dry_run: bool = False
+
+class Grade(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    student_id: str
+    course_id: str
+    exam_type: ExamType
+    score: float
+    max_score: float
+    exam_date: datetime
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class GradeCreate(BaseModel):
+    student_id: str
+    course_id: str
+    exam_type: ExamType
+    score: float
+    max_score: float
+    exam_date: datetime
+
+class ExamProposal(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    teacher_id: str
+    course_id: str
+    exam_type: ExamType
+    title: str
+    description: str
+    proposed_date: datetime
+    duration_minutes: int
+    classroom: Optional[str] = None
+    level: Optional[str] = None  # Student cohort sitting the exam: L1, L2, L3, M1, M2
+    status: str = "pending"  # pending, approved, rejected
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ExamProposalCreate(BaseModel):
+    course_id: str
+    exam_type: ExamType
+    title: str
+    description: str
+    proposed_date: datetime
+    duration_minutes: int = Field(..., gt=0, le=MAX_EXAM_MINUTES)
+    classroom: Optional[str] = None
+    level: Optional[str] = None
+
+class Attendance(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    teacher_id: str
+    course_id: str
+    date: datetime
+    status: str = "present"  # present, absent
+    notes: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AttendanceCreate(BaseModel):
+    course_id: str
+    date: datetime
+    status: str = "present"
+    notes: Optional[str] = None
+
+# Serialization
+# Each response shape is a Mongo projection, so list rows come back from the
+# driver ready to encode: no ``_id``, no internal fields and never a password
+# hash on an enriched user. Rows are trusted as stored and encoded by orjson
+# instead of being revalidated through Pydantic.
+def model_projection(model) -> Dict[str, int]:
+    return {"_id": 0, **dict.fromkeys(model.model_fields, 1)}
+
+def model_defaults(model) -> Dict[str, Any]:
+    return {name: field.default for name, field in model.model_fields.items() if not field.is_required()}
+
+USER_RESPONSE_PROJECTION = model_projection(UserResponse)
+USER_RESPONSE_DEFAULTS = model_defaults(UserResponse)
+COURSE_PROJECTION = model_projection(Course)
+SCHEDULE_PROJECTION = model_projection(Schedule)
+GRADE_PROJECTION = model_projection(Grade)
+EXAM_PROPOSAL_PROJECTION = model_projection(ExamProposal)
+ATTENDANCE_PROJECTION = model_projection(Attendance)
+# Shape of related documents attached to list rows, by collection
+RELATED_PROJECTIONS = {"users": USER_RESPONSE_PROJECTION, "courses": COURSE_PROJECTION}
+
+def json_response(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """Encode ``content`` directly, keeping headers set on the injected ``response``"""
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"} if response else None
+    return FastJSONResponse(content, headers=headers)
+
+def trusted_users(users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """UserResponse-shaped rows from documents read with USER_RESPONSE_PROJECTION"""
+    return [{**USER_RESPONSE_DEFAULTS, **user} for user in users]
+
+# Utility functions
+def convert_objectid_to_str(doc):
+    """Convert MongoDB ObjectId to string for JSON serialization"""
+    if doc is None:
+        return None
+    if isinstance(doc, list):
+        return [convert_objectid_to_str(item) for item in doc]
+    if isinstance(doc, dict):
+        if '_id' in doc:
+            doc['_id'] = str(doc['_id'])
+        return doc
+    return doc
+
+def and_query(query: Dict[str, Any], extra: Dict[str, Any]) -> Dict[str, Any]:
+    return {"$and": [query, extra]} if query else extra
+
+async def fetch_by_ids(collection, ids, projection: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+    """Resolve a set of ``id`` values with a single ``$in`` query"""
+    unique_ids = list({i for i in ids if i is not None})
+    if not unique_ids:
+        return {}
+    projection = projection or RELATED_PROJECTIONS.get(collection.name, HIDDEN_FIELDS)
+    docs = await collection.find({"id": {"$in": unique_ids}}, projection).to_list(None)
+    return {doc["id"]: convert_objectid_to_str(doc) for doc in docs}
+
+async def attach_related(docs: List[Dict[str, Any]], **relations) -> List[Dict[str, Any]]:
+    """Attach related documents to each row, one query per collection.
+
+    Each keyword maps the target field to a ``(foreign_key, collection)`` pair,
+    e.g. ``attach_related(grades, course=("course_id", db.courses))``.
+    Relations sharing a collection are resolved together.
+    """
+    wanted: Dict[str, set] = {}
+    for foreign_key, collection in relations.values():
+        ids = wanted.setdefault(collection.name, set())
+        ids.update(doc.get(foreign_key) for doc in docs)
+
+    collections = {collection.name: collection for _, collection in relations.values()}
+    lookups = {}
+    for name, ids in wanted.items():
+        lookups[name] = await fetch_by_ids(collections[name], ids)
+
+    for doc in docs:
+        doc.pop("_id", None)
+        for field, (foreign_key, collection) in relations.items():
+            doc[field] = lookups[collection.name].get(doc.get(foreign_key))
+    return docs
+
+# Indexes
+# Every collection is addressed by its uuid ``id``; the remaining indexes back
+# the filters used by the handlers below.
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("role", ASCENDING), ("status", ASCENDING)], name="role_status"),
+        IndexModel([("student_id", ASCENDING)], name="student_id"),
+        IndexModel([("search_keys", ASCENDING)], name="search_keys"),
+    ],
+    "courses": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("teacher_id", ASCENDING), ("_id", ASCENDING)], name="teacher_id"),
+        IndexModel([("year", ASCENDING), ("semester", ASCENDING)], name="year_semester"),
+        IndexModel([("search_keys", ASCENDING)], name="search_keys"),
+    ],
+    "schedules": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("course_id", ASCENDING), ("_id", ASCENDING)], name="course_id"),
+        IndexModel(
+            [("classroom", ASCENDING), ("day_of_week", ASCENDING), ("start_minute", ASCENDING)],
+            name="classroom_day_start",
+        ),
+        IndexModel(
+            [("teacher_id", ASCENDING), ("day_of_week", ASCENDING), ("start_minute", ASCENDING)],
+            name="teacher_day_start",
+        ),
+        IndexModel([("day_of_week", ASCENDING), ("start_time", ASCENDING)], name="day_start"),
+    ],
+    "grades": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("student_id", ASCENDING), ("course_id", ASCENDING)], name="student_course"),
+        IndexModel([("student_id", ASCENDING), ("_id", ASCENDING)], name="student_id"),
+        IndexModel([("course_id", ASCENDING), ("exam_type", ASCENDING)], name="course_exam_type"),
+    ],
+    "exam_proposals": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("teacher_id", ASCENDING), ("status", ASCENDING)], name="teacher_status"),
+        IndexModel([("teacher_id", ASCENDING), ("_id", ASCENDING)], name="teacher_id"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("clash_keys", ASCENDING), ("proposed_date", ASCENDING)], name="clash_keys_date"),
+    ],
+    "attendance": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("teacher_id", ASCENDING), ("date", DESCENDING)], name="teacher_date"),
+        IndexModel([("teacher_id", ASCENDING), ("_id", ASCENDING)], name="teacher_id"),
+        IndexModel([("course_id", ASCENDING), ("date", DESCENDING)], name="course_date"),
+    ],
+    "attendance_rollups": [
+        IndexModel([("course_id", ASCENDING), ("period", ASCENDING), ("period_start", ASCENDING)], name="course_period_start"),
+        IndexModel([("period", ASCENDING), ("period_start", ASCENDING)], name="period_start"),
+    ],
+    "stream_tokens": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "import_jobs": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("started_at", ASCENDING)], expireAfterSeconds=IMPORT_JOB_RETENTION_SECONDS, name="started_at_ttl"),
+    ],
+}
+
+# Representative filters issued by the handlers, checked by the index report
+QUERY_SHAPES = [
+    ("users", {"id": ""}),
+    ("users", {"email": ""}),
+    ("users", {"role": "student"}),
+    ("users", {"role": "student", "status": "active"}),
+    ("users", {"search_keys": {"$all": [""]}}),
+    ("courses", {"id": ""}),
+    ("courses", {"teacher_id": ""}),
+    ("courses", {"year": 0}),
+    ("courses", {"search_keys": {"$all": [""]}}),
+    ("schedules", {"id": ""}),
+    ("schedules", {"course_id": ""}),
+    ("schedules", {"classroom": "", "day_of_week": "", "start_minute": {"$lt": 0}, "end_minute": {"$gt": 0}}),
+    ("schedules", {"teacher_id": "", "day_of_week": "", "start_minute": {"$lt": 0}, "end_minute": {"$gt": 0}}),
+    ("grades", {"id": ""}),
+    ("grades", {"student_id": ""}),
+    ("grades", {"course_id": {"$in": [""]}}),
+    ("grades", {"course_id": "", "exam_type": "final"}),
+    ("exam_proposals", {"id": ""}),
+    ("exam_proposals", {"teacher_id": ""}),
+    ("exam_proposals", {"status": "pending"}),
+    ("exam_proposals", {"clash_keys": {"$in": [""]}, "proposed_date": {"$gt": datetime(2000, 1, 1), "$lt": datetime(2000, 1, 2)}}),
+    ("attendance", {"teacher_id": ""}),
+    ("attendance", {"course_id": ""}),
+    ("attendance_rollups", {"course_id": "", "period": "week", "period_start": {"$gte": datetime(2000, 1, 1)}}),
+    ("attendance_rollups", {"period": "day", "period_start": {"$gte": datetime(2000, 1, 1)}}),
+    ("import_jobs", {"id": ""}),
+]
+
+async def ensure_indexes() -> None:
+    """Create the declared indexes; safe to run on every startup"""
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                await db[collection_name].create_indexes([index])
+            except OperationFailure as exc:
+                # e.g. duplicate emails already stored: keep booting, but say so
+                logger.warning(
+                    "Could not create index %s on %s: %s",
+                    index.document["name"], collection_name, exc,
+                )
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage", "")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+async def explain_query(collection_name: str, query: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the winning plan stages for ``query`` and whether it scans the collection"""
+    explain = await db.command(
+        "explain", {"find": collection_name, "filter": query}, verbosity="queryPlanner"
+    )
+    stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+    return {"stages": stages, "collection_scan": "COLLSCAN" in stages}
+
+# Pagination
+def encode_cursor(last_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(last_id.binary).decode("ascii")
+
+def decode_cursor(cursor: str) -> ObjectId:
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    response: Response,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Dict[str, Any] = HIDDEN_FIELDS,
+) -> List[Dict[str, Any]]:
+    """Fetch one page ordered by ``_id`` and advertise the next cursor.
+
+    Pages are keyed on the last ``_id`` seen rather than an offset, so deep
+    pages cost the same as the first one. ``_id`` is only read for the
+    cursor and dropped from the returned rows.
+    """
+    if cursor:
+        query = and_query(query, {"_id": {"$gt": decode_cursor(cursor)}})
+    if projection.get("_id") == 0:
+        projection = {**projection, "_id": 1}
+    docs = await collection.find(query, projection).sort("_id", ASCENDING).limit(limit + 1).to_list(None)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1]["_id"])
+    for doc in docs:
+        doc.pop("_id", None)
+    return docs
+
+# Export
+EXPORT_COLUMNS = {
+    "grades": [
+        "id", "student_id", "student_number", "student_name", "course_id", "course_code",
+        "course_name", "exam_type", "score", "max_score", "exam_date", "created_at",
+    ],
+    "users": [
+        "id", "email", "first_name", "last_name", "role", "student_id", "department", "year",
+        "status", "specialty", "level", "field_of_study", "phone", "address", "created_at",
+    ],
+    "attendance": [
+        "id", "teacher_id", "teacher_name", "course_id", "course_code", "course_name",
+        "date", "status", "notes", "created_at",
+    ],
+}
+
+COURSE_NAME_PROJECTION = {"_id": 0, "id": 1, "code": 1, "name": 1}
+USER_NAME_PROJECTION = {"_id": 0, "id": 1, "first_name": 1, "last_name": 1, "student_id": 1}
+
+def _full_name(user: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not user:
+        return None
+    return f"{user['first_name']} {user['last_name']}"
+
+async def iterate_batches(cursor, size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Group an async Motor cursor into lists of at most ``size`` documents"""
+    batch = []
+    async for doc in cursor.batch_size(size):
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def export_rows(collection_name: str) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield flattened export rows batch by batch, joining names per batch"""
+    cursor = db[collection_name].find({}, {"_id": 0, "password": 0})
+    async for batch in iterate_batches(cursor):
+        if collection_name == "grades":
+            courses = await fetch_by_ids(db.courses, (g["course_id"] for g in batch), COURSE_NAME_PROJECTION)
+            students = await fetch_by_ids(db.users, (g["student_id"] for g in batch), USER_NAME_PROJECTION)
+            for grade in batch:
+                course = courses.get(grade["course_id"], {})
+                student = students.get(grade["student_id"])
+                grade["course_code"] = course.get("code")
+                grade["course_name"] = course.get("name")
+                grade["student_number"] = student.get("student_id") if student else None
+                grade["student_name"] = _full_name(student)
+        elif collection_name == "attendance":
+            courses = await fetch_by_ids(db.courses, (a["course_id"] for a in batch), COURSE_NAME_PROJECTION)
+            teachers = await fetch_by_ids(db.users, (a["teacher_id"] for a in batch), USER_NAME_PROJECTION)
+            for record in batch:
+                course = courses.get(record["course_id"], {})
+                record["course_code"] = course.get("code")
+                record["course_name"] = course.get("name")
+                record["teacher_name"] = _full_name(teachers.get(record["teacher_id"]))
+        yield batch
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+async def stream_ndjson(collection_name: str) -> AsyncIterator[str]:
+    columns = EXPORT_COLUMNS[collection_name]
+    async for batch in export_rows(collection_name):
+        yield "".join(
+            json.dumps({column: _export_value(row.get(column)) for column in columns}) + "\n"
+            for row in batch
+        )
+
+async def stream_csv(collection_name: str) -> AsyncIterator[str]:
+    columns = EXPORT_COLUMNS[collection_name]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for batch in export_rows(collection_name):
+        for row in batch:
+            writer.writerow([_export_value(row.get(column)) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty collection
+    if buffer.tell():
+        yield buffer.getvalue()
+
+# Bulk ingestion
+async def read_bulk_rows(request: Request) -> List[Dict[str, Any]]:
+    """Parse a bulk request body sent as a JSON array or as CSV with a header row"""
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            rows = list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+            # Empty CSV cells mean "not provided"
+            rows = [{k: v for k, v in row.items() if v not in ("", None)} for row in rows]
+        else:
+            rows = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Body must be a JSON array or CSV with a header row"
+        )
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Body must be a JSON array of objects"
+        )
+    if len(rows) > MAX_BULK_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_BULK_ROWS} rows per request"
+        )
+    return rows
+
+def validation_detail(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+    )
+
+def parse_bulk_rows(rows: List[Dict[str, Any]], model, errors: List[Dict[str, Any]]) -> List[tuple]:
+    """Validate rows against ``model``; returns ``(row_number, instance)`` pairs and records failures"""
+    parsed = []
+    for row_number, row in enumerate(rows, start=1):
+        # csv.DictReader files fields beyond the header under a None key
+        if None in row:
+            errors.append({"row": row_number, "detail": "Unexpected extra columns"})
+            continue
+        try:
+            parsed.append((row_number, model(**row)))
+        except ValidationError as exc:
+            errors.append({"row": row_number, "detail": validation_detail(exc)})
+    return parsed
+
+async def insert_bulk(collection, rows: List[tuple], errors: List[Dict[str, Any]]) -> List[tuple]:
+    """Unordered insert_many of ``(row_number, document)`` pairs; returns the pairs that were written"""
+    failed = set()
+    for start in range(0, len(rows), EXPORT_BATCH_SIZE):
+        chunk = rows[start:start + EXPORT_BATCH_SIZE]
+        try:
+            await collection.insert_many([doc for _, doc in chunk], ordered=False)
+        except BulkWriteError as exc:
+            for write_error in exc.details["writeErrors"]:
+                row_number = chunk[write_error["index"]][0]
+                failed.add(row_number)
+                errors.append({"row": row_number, "detail": write_error["errmsg"]})
+    if len(failed) < len(rows):
+        await collection_versions.bump(collection.name)
+    return [(row_number, doc) for row_number, doc in rows if row_number not in failed]
+
+def bulk_report(inserted: int, errors: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "inserted": inserted,
+        "failed": len(errors),
+        "errors": sorted(errors, key=lambda error: error["row"]),
+    }
+
+# Search
+# Courses and users carry a ``search_keys`` array holding every prefix of every
+# word in their searchable fields, kept up to date by the write handlers.
+# Matching a search is then an equality lookup on a multikey index instead of
+# an unanchored regex scan. ``search_ranks`` maps each of those prefixes to
+# its relevance score, so results are ranked and paged inside Mongo.
+SEARCH_FIELDS = {
+    "courses": {"name": 3, "code": 3, "description": 1},
+    "users": {"first_name": 3, "last_name": 3, "email": 2, "student_id": 2},
+}
+
+_WORD_RE = re.compile(r"\w+")
+
+def search_words(text) -> List[str]:
+    if not text:
+        return []
+    return [word[:MAX_SEARCH_PREFIX] for word in _WORD_RE.findall(str(text).lower())]
+
+def build_search_index(doc: Dict[str, Any], collection_name: str) -> Dict[str, Any]:
+    """``search_keys`` and ``search_ranks`` for a document.
+
+    A searched word scores its field's weight in every field where it starts
+    a word, doubled where it is the whole word.
+    """
+    ranks: Dict[str, int] = defaultdict(int)
+    for field, weight in SEARCH_FIELDS[collection_name].items():
+        words = set(search_words(doc.get(field)))
+        prefixes = {word[:i] for word in words for i in range(1, len(word) + 1)}
+        for prefix in prefixes:
+            ranks[prefix] += 2 * weight if prefix in words else weight
+    return {"search_keys": sorted(ranks), "search_ranks": dict(sorted(ranks.items()))}
+
+def encode_search_cursor(score: int, last_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(score.to_bytes(4, "big") + last_id.binary).decode("ascii")
+
+def decode_search_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        if len(raw) != 16:
+            raise ValueError(cursor)
+        return int.from_bytes(raw[:4], "big"), ObjectId(raw[4:])
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def search_documents(
+    collection_name: str,
+    query: Dict[str, Any],
+    search: str,
+    response: Response,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Dict[str, Any] = HIDDEN_FIELDS,
+) -> List[Dict[str, Any]]:
+    """Fetch one page of the documents matching every word of ``search``, most relevant first.
+
+    Scores are summed from ``search_ranks`` and sorted by Mongo; pages are keyed
+    on the last (score, ``_id``) seen and the next cursor is advertised as in
+    ``fetch_page``.
+    """
+    words = search_words(search)
+    if not words:
+        # Punctuation-only searches have nothing to match, like the old regex
+        return []
+    score = {"$add": [{"$ifNull": [f"$search_ranks.{word}", 0]} for word in words]}
+    pipeline = [
+        {"$match": and_query(query, {"search_keys": {"$all": words}})},
+        {"$addFields": {"_score": score}},
+    ]
+    if cursor:
+        last_score, last_id = decode_search_cursor(cursor)
+        pipeline.append({"$match": {"$or": [
+            {"_score": {"$lt": last_score}},
+            {"_score": last_score, "_id": {"$gt": last_id}},
+        ]}})
+    if projection.get("_id") == 0:
+        projection = {**projection, "_id": 1}
+    if any(value for name, value in projection.items() if name != "_id"):
+        projection = {**projection, "_score": 1}
+    pipeline += [
+        {"$sort": {"_score": DESCENDING, "_id": ASCENDING}},
+        {"$limit": limit + 1},
+        {"$project": projection},
+    ]
+    docs = await db[collection_name].aggregate(pipeline).to_list(None)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_search_cursor(docs[-1]["_score"], docs[-1]["_id"])
+    for doc in docs:
+        doc.pop("_id", None)
+        doc.pop("_score", None)
+    return docs
+
+async def matching_ids(
+    collection_name: str,
+    search: str,
+    query: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """Ids of the documents matching every word of ``search``, resolved from the index"""
+    words = search_words(search)
+    if not words:
+        return []
+    return await db[collection_name].distinct("id", {"search_keys": {"$all": words}, **(query or {})})
+
+async def matching_values(collection, field: str, search: str) -> List[str]:
+    """Distinct values of a short free-text field that contain ``search``"""
+    needle = search.strip().lower()
+    return [value for value in await collection.distinct(field) if needle in str(value).lower()]
+
+async def backfill_search_keys() -> None:
+    """Populate the search fields on documents written before search indexing or ranking existed"""
+    for collection_name in SEARCH_FIELDS:
+        collection = db[collection_name]
+        missing = collection.find({"search_ranks": {"$exists": False}})
+        async for batch in iterate_batches(missing):
+            await collection.bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": build_search_index(doc, collection_name)})
+                for doc in batch
+            ])
+
+# Dashboard counters
+# /stats is served from small documents in the ``stats`` collection that the
+# write handlers keep current with $inc. A periodic recount bounds any drift,
+# e.g. from a crash between a write and its counter update.
+GLOBAL_COUNTERS = "global"
+
+def teacher_counters(teacher_id: str) -> str:
+    return f"teacher:{teacher_id}"
+
+def student_counters(student_id: str) -> str:
+    return f"student:{student_id}"
+
+def role_counter(role) -> str:
+    return f"{UserRole(role).value}s"
+
+async def increment_counters(*changes) -> None:
+    """Apply ``(counter_key, field, delta)`` changes in one round trip"""
+    increments: Dict[str, Dict[str, int]] = {}
+    for key, field, delta in changes:
+        fields = increments.setdefault(key, {})
+        fields[field] = fields.get(field, 0) + delta
+    operations = [
+        UpdateOne({"_id": key}, {"$inc": fields}, upsert=True)
+        for key, fields in increments.items()
+    ]
+    if operations:
+        await db.stats.bulk_write(operations, ordered=False)
+
+async def reconcile_counters() -> None:
+    """Recount every counter document from the source collections"""
+    started = datetime.utcnow()
+    counters: Dict[str, Dict[str, int]] = {
+        GLOBAL_COUNTERS: {"students": 0, "teachers": 0, "admins": 0, "courses": 0, "pending_proposals": 0},
+    }
+    totals = counters[GLOBAL_COUNTERS]
+    async for row in db.users.aggregate([{"$group": {"_id": "$role", "count": {"$sum": 1}}}]):
+        try:
+            totals[role_counter(row["_id"])] = row["count"]
+        except ValueError:
+            # Legacy rows without a known role are left out rather than failing the recount
+            logger.warning("Counter reconciliation: skipped %d users with role %r", row["count"], row["_id"])
+    async for row in db.courses.aggregate([{"$group": {"_id": "$teacher_id", "count": {"$sum": 1}}}]):
+        totals["courses"] += row["count"]
+        counters.setdefault(teacher_counters(row["_id"]), {})["courses"] = row["count"]
+    async for row in db.exam_proposals.aggregate([{"$group": {
+        "_id": "$teacher_id",
+        "count": {"$sum": 1},
+        "pending": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, 1, 0]}},
+    }}]):
+        totals["pending_proposals"] += row["pending"]
+        counters.setdefault(teacher_counters(row["_id"]), {})["proposals"] = row["count"]
+    async for row in db.grades.aggregate([{"$group": {"_id": "$student_id", "count": {"$sum": 1}}}]):
+        counters.setdefault(student_counters(row["_id"]), {})["grades"] = row["count"]
+
+    operations = [
+        ReplaceOne({"_id": key}, {**fields, "reconciled_at": started}, upsert=True)
+        for key, fields in counters.items()
+    ]
+    for start in range(0, len(operations), EXPORT_BATCH_SIZE):
+        await db.stats.bulk_write(operations[start:start + EXPORT_BATCH_SIZE], ordered=False)
+    # Counters whose source rows are all gone; ones created by $inc since we
+    # started have no reconciled_at and are left alone
+    await db.stats.delete_many({"reconciled_at": {"$lt": started}})
+
+async def reconcile_counters_periodically() -> None:
+    while True:
+        try:
+            await reconcile_counters()
+        except Exception:
+            logger.exception("Dashboard counter reconciliation failed")
+        await asyncio.sleep(STATS_RECONCILE_SECONDS)
+
+# Collection versions
+# Every write bumps a per-collection counter in ``versions``. Each worker
+# mirrors the counters in memory, refreshed every VERSION_POLL_SECONDS, so
+# list endpoints answer If-None-Match from memory without querying Mongo.
+class CollectionVersions:
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+
+    def _observe(self, name: str, version: int) -> None:
+        self.versions[name] = max(self.versions.get(name, 0), version)
+
+    async def bump(self, *names: str) -> None:
+        for name in names:
+            doc = await db.versions.find_one_and_update(
+                {"_id": name}, {"$inc": {"version": 1}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            self._observe(name, doc["version"])
+
+    async def refresh(self) -> None:
+        async for doc in db.versions.find():
+            self._observe(doc["_id"], doc["version"])
+
+    def etag(self, request: Request, user: Dict[str, Any], *names: str) -> str:
+        """Strong ETag of a list response: route, query, caller and collection versions"""
+        parts = [request.url.path, str(sorted(request.query_params.multi_items())), user["id"]]
+        parts.extend(f"{name}:{self.versions.get(name, 0)}" for name in names)
+        return '"%s"' % hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]
+
+collection_versions = CollectionVersions()
+
+async def refresh_versions_periodically() -> None:
+    while True:
+        try:
+            await collection_versions.refresh()
+        except Exception:
+            logger.exception("Collection version refresh failed")
+        await asyncio.sleep(VERSION_POLL_SECONDS)
+
+def _opaque_tag(tag: str) -> str:
+    """ETag without weakness prefix or the content-coding suffix added on compression"""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for coding in CONTENT_CODINGS:
+        if tag.endswith(f'-{coding}"'):
+            return tag[:-len(coding) - 2] + '"'
+    return tag
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Tag the response; return a 304 instead when the client already has this version"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    response.headers.update(headers)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in (_opaque_tag(tag) for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+# Event push
+# Grade and exam proposal changes are published to an in-process broker and
+# pushed to the affected users over Server-Sent Events, so clients stop
+# polling the enriched list endpoints. Subscribers are local to the worker
+# that accepted their stream.
+def grade_event(event_type: str, grade: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": event_type,
+        "grade_id": grade["id"],
+        "course_id": grade["course_id"],
+        "exam_type": grade["exam_type"],
+        "score": grade["score"],
+        "max_score": grade["max_score"],
+    }
+
+class EventBroker:
+    """Fan-out of small change events to per-connection queues, keyed by user.
+
+    A subscriber that falls ``queue_size`` events behind has its queue
+    replaced by a single ``resync`` event telling the client to refetch.
+    """
+
+    def __init__(self, queue_size: int, max_streams: int):
+        self.queue_size = queue_size
+        self.max_streams = max_streams
+        self.sequence = 0
+        self.published = 0
+        self.dropped = 0
+        self._subscribers: Dict[str, set] = defaultdict(set)
+
+    @property
+    def streams(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        if self.streams >= self.max_streams:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many open event streams",
+                headers={"Retry-After": "5"},
+            )
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, user_ids, event: Dict[str, Any]) -> None:
+        for user_id in {user_id for user_id in user_ids if user_id}:
+            for queue in self._subscribers.get(user_id, ()):
+                self.sequence += 1
+                message = (self.sequence, event)
+                try:
+                    queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    self.dropped += queue.qsize()
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait((self.sequence, {"type": "resync"}))
+                self.published += 1
+
+    def close(self) -> None:
+        """End every open stream, e.g. on shutdown"""
+        for queues in self._subscribers.values():
+            for queue in queues:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "streams": self.streams,
+            "users": len(self._subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+event_broker = EventBroker(EVENT_QUEUE_SIZE, MAX_EVENT_STREAMS)
+
+async def event_stream(request: Request, user_id: str, queue: asyncio.Queue) -> AsyncIterator[str]:
+    """SSE frames for one subscriber, with comment keep-alives while idle"""
+    try:
+        yield f"retry: {EVENT_RETRY_MS}\n: connected\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            if message is None:
+                return
+            sequence, event = message
+            data = orjson.dumps(event, default=_json_default).decode()
+            yield f"id: {sequence}\nevent: {event['type']}\ndata: {data}\n\n"
+    finally:
+        event_broker.unsubscribe(user_id, queue)
+
+# Transcripts
+# A student's transcript is stored precomputed in ``transcripts`` and rebuilt
+# from that student's grades whenever a grade or course write touches them,
+# so reading one is a single document fetch. Each rebuild first bumps the
+# student's version in ``transcript_versions`` and stores the transcript only
+# over an older version, so a rebuild that read the grades earlier never
+# overwrites a newer one.
+EXAM_TYPE_WEIGHTS = {ExamType.CONTINUOUS.value: 0.4, ExamType.FINAL.value: 0.6}
+TRANSCRIPT_GRADE_PROJECTION = {"_id": 0, "student_id": 1, "course_id": 1, "exam_type": 1, "score": 1, "max_score": 1}
+TRANSCRIPT_COURSE_PROJECTION = {"_id": 0, "id": 1, "code": 1, "name": 1, "credits": 1, "year": 1, "semester": 1}
+TRANSCRIPT_PROJECTION = {"_id": 0, "version": 0}
+
+def _weighted_mean(pairs) -> Optional[float]:
+    pairs = list(pairs)
+    total_weight = sum(weight for _, weight in pairs)
+    if not total_weight:
+        return None
+    return sum(value * weight for value, weight in pairs) / total_weight
+
+def build_transcript(student_id: str, grades: List[Dict[str, Any]], courses: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Compute course averages, semester GPAs and the cumulative GPA for one student.
+
+    Each score is normalized by its ``max_score``; a course average weights the
+    continuous and final means by EXAM_TYPE_WEIGHTS (renormalized when only one
+    kind exists) and GPAs are credit-weighted means of course averages.
+    """
+    scores: Dict[str, Dict[str, List[float]]] = {}
+    for grade in grades:
+        if grade["course_id"] not in courses or not grade["max_score"]:
+            continue
+        by_type = scores.setdefault(grade["course_id"], {})
+        by_type.setdefault(ExamType(grade["exam_type"]).value, []).append(grade["score"] / grade["max_score"])
+
+    course_rows = []
+    for course_id, by_type in scores.items():
+        course = courses[course_id]
+        means = {exam_type: sum(values) / len(values) for exam_type, values in by_type.items()}
+        average = _weighted_mean((mean, EXAM_TYPE_WEIGHTS[exam_type]) for exam_type, mean in means.items()) * GRADE_SCALE
+        course_rows.append({
+            "course_id": course_id,
+            "code": course["code"],
+            "name": course["name"],
+            "credits": course["credits"],
+            "year": course["year"],
+            "semester": course["semester"],
+            "continuous_average": round(means[ExamType.CONTINUOUS.value] * GRADE_SCALE, 2) if ExamType.CONTINUOUS.value in means else None,
+            "final_average": round(means[ExamType.FINAL.value] * GRADE_SCALE, 2) if ExamType.FINAL.value in means else None,
+            "average": round(average, 2),
+            "grade_count": sum(len(values) for values in by_type.values()),
+            "passed": average >= PASS_MARK,
+        })
+    course_rows.sort(key=lambda row: (row["year"], row["semester"], row["code"]))
+
+    def summarize(rows):
+        gpa = _weighted_mean((row["average"], row["credits"]) for row in rows)
+        return {
+            "gpa": round(gpa, 2) if gpa is not None else None,
+            "credits_attempted": sum(row["credits"] for row in rows),
+            "credits_earned": sum(row["credits"] for row in rows if row["passed"]),
+        }
+
+    semesters: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in course_rows:
+        semesters.setdefault((row["year"], row["semester"]), []).append(row)
+
+    return {
+        "_id": student_id,
+        "student_id": student_id,
+        "scale": GRADE_SCALE,
+        "courses": course_rows,
+        "semesters": [
+            {"year": year, "semester": semester, **summarize(rows)}
+            for (year, semester), rows in semesters.items()
+        ],
+        "cumulative": summarize(course_rows),
+        "updated_at": datetime.utcnow(),
+    }
+
+async def refresh_transcripts(student_ids) -> None:
+    """Rebuild the stored transcripts of the given students in batches"""
+    student_ids = list({student_id for student_id in student_ids if student_id})
+    for start in range(0, len(student_ids), EXPORT_BATCH_SIZE):
+        chunk = student_ids[start:start + EXPORT_BATCH_SIZE]
+        await db.transcript_versions.bulk_write([
+            UpdateOne({"_id": student_id}, {"$inc": {"version": 1}}, upsert=True) for student_id in chunk
+        ], ordered=False)
+        versions = {
+            doc["_id"]: doc["version"]
+            for doc in await db.transcript_versions.find({"_id": {"$in": chunk}}).to_list(None)
+        }
+        grades = await db.grades.find({"student_id": {"$in": chunk}}, TRANSCRIPT_GRADE_PROJECTION).to_list(None)
+        courses = await fetch_by_ids(db.courses, (g["course_id"] for g in grades), TRANSCRIPT_COURSE_PROJECTION)
+        by_student: Dict[str, List[Dict[str, Any]]] = {}
+        for grade in grades:
+            by_student.setdefault(grade["student_id"], []).append(grade)
+        try:
+            await db.transcripts.bulk_write([
+                ReplaceOne(
+                    {"_id": student_id, "version": {"$not": {"$gte": versions[student_id]}}},
+                    {**build_transcript(student_id, by_student.get(student_id, []), courses), "version": versions[student_id]},
+                    upsert=True,
+                )
+                for student_id in chunk
+            ], ordered=False)
+        except BulkWriteError as exc:
+            # Duplicate keys are upserts that lost to a newer version
+            if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+                raise
+
+async def refresh_course_transcripts(course_id: str) -> None:
+    await refresh_transcripts(await db.grades.distinct("student_id", {"course_id": course_id}))
+
+# Grade statistics
+# Per course (and per exam type) score distributions are cached in
+# ``grade_stats``, tagged with the course's generation from
+# ``grade_stats_generations``. Grade writes bump the generation, so dashboards
+# only pay for a recomputation after the grades of that course actually change,
+# and a result computed from grades read before a write is never served after it.
+STATS_PERCENTILES = (10, 25, 50, 75, 90)
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    """Linear-interpolated percentile of an already sorted list"""
+    position = (len(ordered) - 1) * pct / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def compute_grade_stats(scores: List[float]) -> Dict[str, Any]:
+    """Distribution summary of scores already normalized to GRADE_SCALE"""
+    bin_width = GRADE_SCALE / HISTOGRAM_BINS
+    histogram = [0] * HISTOGRAM_BINS
+    for score in scores:
+        histogram[min(max(int(score // bin_width), 0), HISTOGRAM_BINS - 1)] += 1
+    histogram = [
+        {"from": round(i * bin_width, 2), "to": round((i + 1) * bin_width, 2), "count": count}
+        for i, count in enumerate(histogram)
+    ]
+    if not scores:
+        return {"count": 0, "mean": None, "median": None, "std_dev": None, "min": None, "max": None,
+                "pass_rate": None, "percentiles": {}, "histogram": histogram}
+
+    ordered = sorted(scores)
+    count = len(ordered)
+    mean = sum(ordered) / count
+    variance = sum((score - mean) ** 2 for score in ordered) / count
+    return {
+        "count": count,
+        "mean": round(mean, 2),
+        "median": round(_percentile(ordered, 50), 2),
+        "std_dev": round(math.sqrt(variance), 2),
+        "min": round(ordered[0], 2),
+        "max": round(ordered[-1], 2),
+        "pass_rate": round(sum(1 for score in ordered if score >= PASS_MARK) / count, 4),
+        "percentiles": {f"p{pct}": round(_percentile(ordered, pct), 2) for pct in STATS_PERCENTILES},
+        "histogram": histogram,
+    }
+
+def grade_stats_key(course_id: str, exam_type: Optional[str]) -> str:
+    return f"{course_id}:{exam_type or 'all'}"
+
+async def grade_stats_generation(course_id: str) -> int:
+    doc = await db.grade_stats_generations.find_one({"_id": course_id})
+    return doc["generation"] if doc else 0
+
+async def get_course_grade_stats(course_id: str, exam_type: Optional[str]) -> Dict[str, Any]:
+    key = grade_stats_key(course_id, exam_type)
+    # Read before the grades: a write after this point bumps the generation
+    generation = await grade_stats_generation(course_id)
+    cached = await db.grade_stats.find_one({"_id": key}, {"_id": 0})
+    if cached is not None and cached.pop("generation", None) == generation:
+        return cached
+
+    query = {"course_id": course_id}
+    if exam_type:
+        query["exam_type"] = exam_type
+    rows = await db.grades.find(query, {"_id": 0, "score": 1, "max_score": 1}).to_list(None)
+    scores = [row["score"] / row["max_score"] * GRADE_SCALE for row in rows if row["max_score"]]
+    result = {
+        "course_id": course_id,
+        "exam_type": exam_type,
+        "scale": GRADE_SCALE,
+        **compute_grade_stats(scores),
+        "computed_at": datetime.utcnow(),
+    }
+    try:
+        # Never replace a result computed at a newer generation
+        await db.grade_stats.replace_one(
+            {"_id": key, "generation": {"$not": {"$gte": generation}}},
+            {**result, "generation": generation},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        pass
+    return result
+
+async def invalidate_grade_stats(course_ids) -> None:
+    course_ids = list({course_id for course_id in course_ids if course_id})
+    if course_ids:
+        await db.grade_stats_generations.bulk_write([
+            UpdateOne({"_id": course_id}, {"$inc": {"generation": 1}}, upsert=True)
+            for course_id in course_ids
+        ], ordered=False)
+
+# Attendance rollups
+# Present/absent counts per course and day and per course and ISO week are
+# kept in ``attendance_rollups`` by upserted $inc on every mark, so trend
+# and semester reports read rollups instead of raw attendance rows. A full
+# recount runs inside Mongo, in the background of the worker that starts it.
+ROLLUP_PERIODS = ("day", "week")
+ROLLUP_PROJECTION = {"_id": 0, "course_id": 1, "period_start": 1, "present": 1, "absent": 1, "total": 1}
+
+def as_naive_utc(date: datetime) -> datetime:
+    """``date`` as Mongo stores it: naive UTC, whatever offset it arrived with"""
+    return date.astimezone(timezone.utc).replace(tzinfo=None) if date.tzinfo else date
+
+def rollup_period_start(date: datetime, period: str) -> datetime:
+    # Bucket by the UTC day, as rollup_period_start_expression does on the stored row
+    date = as_naive_utc(date)
+    day = datetime(date.year, date.month, date.day)
+    return day - timedelta(days=day.weekday()) if period == "week" else day
+
+def rollup_counts(rows) -> Dict[tuple, Dict[str, int]]:
+    """Present/absent/total counts of attendance rows per (course, period, period start)"""
+    counts: Dict[tuple, Dict[str, int]] = {}
+    for row in rows:
+        for period in ROLLUP_PERIODS:
+            key = (row["course_id"], period, rollup_period_start(row["date"], period))
+            bucket = counts.setdefault(key, {"present": 0, "absent": 0, "total": 0})
+            bucket["total"] += 1
+            if row["status"] in ("present", "absent"):
+                bucket[row["status"]] += 1
+    return counts
+
+def rollup_id(course_id: str, period: str, period_start: datetime) -> str:
+    return f"{course_id}|{period}|{period_start.date().isoformat()}"
+
+def rollup_period_start_expression(period: str) -> Dict[str, Any]:
+    """``rollup_period_start`` of an attendance row's ``date`` as an aggregation expression"""
+    day = {"$dateFromParts": {"year": {"$year": "$date"}, "month": {"$month": "$date"}, "day": {"$dayOfMonth": "$date"}}}
+    if period != "week":
+        return day
+    # $dayOfWeek counts from Sunday = 1; days since Monday is ($dayOfWeek + 5) % 7
+    days_since_monday = {"$mod": [{"$add": [{"$dayOfWeek": "$date"}, 5]}, 7]}
+    return {"$subtract": [day, {"$multiply": [days_since_monday, 24 * 3600 * 1000]}]}
+
+def attendance_rate(counts: Dict[str, Any]) -> Optional[float]:
+    return round(counts["present"] / counts["total"], 4) if counts["total"] else None
+
+async def record_attendance(rows: List[Dict[str, Any]]) -> None:
+    await db.attendance_rollups.bulk_write([
+        UpdateOne(
+            {"_id": rollup_id(*key)},
+            {
+                "$inc": counts,
+                "$max": {"updated_at": datetime.utcnow()},
+                "$setOnInsert": {"course_id": key[0], "period": key[1], "period_start": key[2]},
+            },
+            upsert=True,
+        )
+        for key, counts in rollup_counts(rows).items()
+    ], ordered=False)
+
+async def rebuild_attendance_rollups() -> None:
+    """Recount every rollup from the raw attendance rows with $group and $merge.
+
+    Rollups a mark has updated since the rebuild started keep their live
+    counts; rollups the recount did not produce are removed.
+    """
+    started = datetime.utcnow()
+    await db.attendance.aggregate([
+        {"$project": {
+            "_id": 0,
+            "course_id": 1,
+            "present": {"$cond": [{"$eq": ["$status", "present"]}, 1, 0]},
+            "absent": {"$cond": [{"$eq": ["$status", "absent"]}, 1, 0]},
+            "starts": [
+                {"period": period, "period_start": rollup_period_start_expression(period)}
+                for period in ROLLUP_PERIODS
+            ],
+        }},
+        {"$unwind": "$starts"},
+        # Grouped straight onto rollup_id
+        {"$group": {
+            "_id": {"$concat": [
+                "$course_id", "|", "$starts.period", "|",
+                {"$dateToString": {"format": "%Y-%m-%d", "date": "$starts.period_start"}},
+            ]},
+            "course_id": {"$first": "$course_id"},
+            "period": {"$first": "$starts.period"},
+            "period_start": {"$first": "$starts.period_start"},
+            "present": {"$sum": "$present"},
+            "absent": {"$sum": "$absent"},
+            "total": {"$sum": 1},
+        }},
+        {"$addFields": {"rebuilt_at": {"$literal": started}}},
+        {"$merge": {
+            "into": "attendance_rollups",
+            "on": "_id",
+            "whenMatched": [{"$replaceWith": {"$cond": [{"$gte": ["$updated_at", started]}, "$$ROOT", "$$new"]}}],
+            "whenNotMatched": "insert",
+        }},
+    ], allowDiskUse=True).to_list(None)
+    await db.attendance_rollups.delete_many({
+        "rebuilt_at": {"$not": {"$gte": started}},
+        "updated_at": {"$not": {"$gte": started}},
+    })
+
+_rollup_rebuild: Optional[asyncio.Task] = None
+
+async def _run_rollup_rebuild() -> None:
+    started = time.perf_counter()
+    try:
+        await rebuild_attendance_rollups()
+    except Exception:
+        logger.exception("Attendance rollup rebuild failed")
+    else:
+        logger.info("Attendance rollups rebuilt in %.1fs", time.perf_counter() - started)
+
+def start_rollup_rebuild() -> bool:
+    """Rebuild the rollups in the background; False if this worker is already rebuilding"""
+    global _rollup_rebuild
+    if _rollup_rebuild is not None and not _rollup_rebuild.done():
+        return False
+    _rollup_rebuild = asyncio.create_task(_run_rollup_rebuild())
+    return True
+
+# Schedule conflicts
+# Schedule documents also store their slot as minute offsets and the teacher
+# of their course, so an overlap check is a range scan on the
+# (classroom|teacher_id, day_of_week, start_minute) indexes.
+SCHEDULE_SLOT_PROJECTION = {
+    "_id": 0, "id": 1, "course_id": 1, "teacher_id": 1, "classroom": 1,
+    "day_of_week": 1, "start_time": 1, "end_time": 1, "start_minute": 1, "end_minute": 1,
+}
+
+def parse_clock(value: str) -> int:
+    """Minutes since midnight for an ``HH:MM`` time"""
+    hours, _, minutes = value.strip().partition(":")
+    hours, minutes = int(hours), int(minutes or 0)
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 24 * 60:
+        raise ValueError(value)
+    return hours * 60 + minutes
+
+def schedule_slot(start_time: str, end_time: str) -> Dict[str, int]:
+    try:
+        start_minute, end_minute = parse_clock(start_time), parse_clock(end_time)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Times must use the HH:MM format"
+        )
+    if end_minute <= start_minute:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End time must be after start time"
+        )
+    return {"start_minute": start_minute, "end_minute": end_minute}
+
+async def schedule_placement(schedule_data: ScheduleCreate) -> Dict[str, Any]:
+    """Derived fields stored with a schedule: its minute offsets and course teacher"""
+    course = await db.courses.find_one({"id": schedule_data.course_id}, {"_id": 0, "teacher_id": 1})
+    return {
+        **schedule_slot(schedule_data.start_time, schedule_data.end_time),
+        "teacher_id": course["teacher_id"] if course else None,
+    }
+
+async def find_schedule_conflicts(
+    schedule: Dict[str, Any],
+    exclude_id: Optional[str] = None,
+    fields: tuple = ("classroom", "teacher_id"),
+) -> List[Dict[str, Any]]:
+    """Entries overlapping ``schedule`` in the same classroom or with the same teacher"""
+    same_slot = [{field: schedule[field]} for field in fields if schedule.get(field)]
+    if not same_slot:
+        return []
+    query = {
+        "day_of_week": schedule["day_of_week"],
+        "start_minute": {"$lt": schedule["end_minute"]},
+        "end_minute": {"$gt": schedule["start_minute"]},
+        "$or": same_slot,
+    }
+    if exclude_id:
+        query["id"] = {"$ne": exclude_id}
+    conflicts = await db.schedules.find(query, SCHEDULE_SLOT_PROJECTION).to_list(None)
+    for conflict in conflicts:
+        same_room = "classroom" in fields and conflict["classroom"] == schedule["classroom"]
+        conflict["conflict"] = "classroom" if same_room else "teacher"
+    return conflicts
+
+def reject_schedule_conflicts(conflicts: List[Dict[str, Any]]) -> None:
+    if conflicts:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Schedule overlaps existing entries", "conflicts": conflicts}
+        )
+
+def sweep_overlaps(entries: List[Dict[str, Any]], field: str) -> List[Dict[str, Any]]:
+    """All overlapping pairs among entries sharing ``field`` and day, in O(n log n + k)"""
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        if entry.get(field):
+            groups.setdefault((entry[field], entry["day_of_week"]), []).append(entry)
+
+    overlaps = []
+    for (value, day), group in groups.items():
+        group.sort(key=lambda entry: entry["start_minute"])
+        active: List[tuple] = []  # heap of (end_minute, position)
+        for position, entry in enumerate(group):
+            while active and active[0][0] <= entry["start_minute"]:
+                heapq.heappop(active)
+            for _, other in active:
+                overlaps.append({field: value, "day_of_week": day, "first": group[other], "second": entry})
+            heapq.heappush(active, (entry["end_minute"], position))
+    return overlaps
+
+async def backfill_schedule_slots() -> None:
+    """Store minute offsets and teachers on schedules written before conflict checks existed"""
+    missing = db.schedules.find({"start_minute": {"$exists": False}})
+    async for batch in iterate_batches(missing):
+        courses = await fetch_by_ids(db.courses, (s["course_id"] for s in batch), {"_id": 0, "id": 1, "teacher_id": 1})
+        operations = []
+        for schedule in batch:
+            try:
+                slot = {"start_minute": parse_clock(schedule["start_time"]), "end_minute": parse_clock(schedule["end_time"])}
+            except ValueError:
+                logger.warning("Schedule %s has unparseable times", schedule["id"])
+                continue
+            course = courses.get(schedule["course_id"])
+            slot["teacher_id"] = course["teacher_id"] if course else None
+            operations.append(UpdateOne({"_id": schedule["_id"]}, {"$set": slot}))
+        if operations:
+            await db.schedules.bulk_write(operations, ordered=False)
+
+# Exam clashes
+# Exam proposals store their end time and one clash key per shared resource
+# (teacher, course, department/level cohort, room). A clash check is then a
+# bounded range scan on the (clash_keys, proposed_date) index: exams last at
+# most MAX_EXAM_MINUTES, so anything overlapping starts within that window.
+CLASHING_STATUSES = ["pending", "approved"]
+EXAM_CLASH_PROJECTION = {
+    "_id": 0, "id": 1, "course_id": 1, "teacher_id": 1, "title": 1, "status": 1,
+    "proposed_date": 1, "ends_at": 1, "created_at": 1, "clash_keys": 1,
+}
+
+def exam_slot(proposal: Dict[str, Any], course: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Derived fields stored with a proposal: its end time and clash keys"""
+    keys = [f"teacher:{proposal['teacher_id']}", f"course:{proposal['course_id']}"]
+    if course and course.get("department") and proposal.get("level"):
+        keys.append(f"cohort:{course['department']}|{proposal['level']}")
+    if proposal.get("classroom"):
+        keys.append(f"room:{proposal['classroom']}")
+    return {
+        "ends_at": proposal["proposed_date"] + timedelta(minutes=proposal["duration_minutes"]),
+        "clash_keys": keys,
+    }
+
+def describe_clash(exam: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    shared = set(exam["clash_keys"]).intersection(other.get("clash_keys", []))
+    clash = {field: value for field, value in other.items() if field != "clash_keys"}
+    clash["clash_on"] = sorted(key.partition(":")[0] for key in shared)
+    return clash
+
+async def find_exam_clashes(
+    exam: Dict[str, Any],
+    statuses: List[str] = CLASHING_STATUSES,
+    exclude_id: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Exams in ``statuses`` overlapping ``exam`` on any of its clash keys"""
+    query = {
+        "clash_keys": {"$in": exam["clash_keys"]},
+        "proposed_date": {
+            "$gt": exam["proposed_date"] - timedelta(minutes=MAX_EXAM_MINUTES),
+            "$lt": exam["ends_at"],
+        },
+        "ends_at": {"$gt": exam["proposed_date"]},
+        "status": {"$in": statuses},
+    }
+    if exclude_id:
+        query["id"] = {"$ne": exclude_id}
+    others = await db.exam_proposals.find(query, EXAM_CLASH_PROJECTION).to_list(None)
+    return [describe_clash(exam, other) for other in others]
+
+def reject_exam_clashes(clashes: List[Dict[str, Any]]) -> None:
+    if clashes:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=jsonable_encoder({"message": "Exam clashes with other exams", "clashes": clashes})
+        )
+
+class ExamIntervalIndex:
+    """In-memory interval index over exams, one start-sorted list per clash key.
+
+    Used by batch approval, which checks many proposals against each other
+    without a query per proposal.
+    """
+
+    def __init__(self):
+        self._intervals: Dict[str, List[tuple]] = defaultdict(list)
+        self._exams: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, exam: Dict[str, Any]) -> None:
+        self._exams[exam["id"]] = exam
+        for key in exam["clash_keys"]:
+            bisect.insort(self._intervals[key], (exam["proposed_date"], exam["ends_at"], exam["id"]))
+
+    def clashes(self, exam: Dict[str, Any]) -> List[Dict[str, Any]]:
+        earliest = exam["proposed_date"] - timedelta(minutes=MAX_EXAM_MINUTES)
+        found: Dict[str, Dict[str, Any]] = {}
+        for key in exam["clash_keys"]:
+            intervals = self._intervals.get(key, [])
+            position = bisect.bisect_right(intervals, (earliest, datetime.max, ""))
+            while position < len(intervals) and intervals[position][0] < exam["ends_at"]:
+                start, end, exam_id = intervals[position]
+                if end > exam["proposed_date"] and exam_id != exam["id"]:
+                    found[exam_id] = self._exams[exam_id]
+                position += 1
+        return [describe_clash(exam, other) for other in found.values()]
+
+async def backfill_exam_slots() -> None:
+    """Store end times and clash keys on proposals written before clash checks existed"""
+    missing = db.exam_proposals.find({"clash_keys": {"$exists": False}})
+    async for batch in iterate_batches(missing):
+        courses = await fetch_by_ids(db.courses, (p["course_id"] for p in batch), {"_id": 0, "id": 1, "department": 1})
+        operations = [
+            UpdateOne({"_id": proposal["_id"]}, {"$set": exam_slot(proposal, courses.get(proposal["course_id"]))})
+            for proposal in batch
+        ]
+        await db.exam_proposals.bulk_write(operations, ordered=False)
+
+# Timetable generation
+class TimetableSolver:
+    """Places course sessions into (day, slot) periods and classrooms.
+
+    A greedy pass places sessions of the busiest teachers first, each into the
+    feasible period that repeats its course's day least and leaves the most
+    rooms free. Sessions it could not place are retried until the time budget
+    runs out, moving one blocking session elsewhere when every room is taken.
+    Any remaining time is spent moving repeated same-day sessions of a course
+    onto other days. Classroom and teacher double-bookings are never allowed.
+    """
+
+    def __init__(
+        self,
+        courses: List[Dict[str, Any]],
+        classrooms: List[str],
+        days: List[str],
+        slots: List[Dict[str, int]],
+        sessions_per_course: int,
+        seed: int = 0,
+    ):
+        self.courses = courses
+        self.classrooms = classrooms
+        self.days = days
+        self.slots = slots
+        self.rng = random.Random(seed)
+        slot_count = len(slots)
+        self.periods = range(len(days) * slot_count)
+        # Periods on the same day whose slots overlap, including the period itself
+        self.blocks = [
+            [
+                day * slot_count + other
+                for other, slot in enumerate(slots)
+                if slot["start_minute"] < slots[index]["end_minute"]
+                and slots[index]["start_minute"] < slot["end_minute"]
+            ]
+            for day in range(len(days))
+            for index in range(slot_count)
+        ]
+        self.sessions = [(course, number) for course in range(len(courses)) for number in range(sessions_per_course)]
+        self.room_load: Dict[tuple, int] = defaultdict(int)
+        self.teacher_load: Dict[tuple, int] = defaultdict(int)
+        self.free_rooms = [set(range(len(classrooms))) for _ in self.periods]
+        self.occupant: Dict[tuple, tuple] = {}
+        self.placement: Dict[tuple, tuple] = {}
+        self.course_days: Dict[tuple, int] = defaultdict(int)
+        self.unplaced: List[tuple] = []
+        self.stats = {"greedy_placed": 0, "repaired": 0, "spread_moves": 0}
+
+    def _day(self, period: int) -> int:
+        return period // len(self.slots)
+
+    def _teacher(self, session: tuple) -> Optional[str]:
+        return self.courses[session[0]].get("teacher_id")
+
+    def block(self, entry: Dict[str, Any]) -> None:
+        """Mark an existing schedule entry as occupying its classroom and teacher"""
+        if entry.get("day_of_week") not in self.days or "start_minute" not in entry:
+            return
+        day = self.days.index(entry["day_of_week"])
+        room = self.classrooms.index(entry["classroom"]) if entry.get("classroom") in self.classrooms else None
+        for index, slot in enumerate(self.slots):
+            if slot["start_minute"] < entry["end_minute"] and entry["start_minute"] < slot["end_minute"]:
+                period = day * len(self.slots) + index
+                if room is not None:
+                    self.room_load[(room, period)] += 1
+                    self.free_rooms[period].discard(room)
+                if entry.get("teacher_id"):
+                    self.teacher_load[(entry["teacher_id"], period)] += 1
+
+    def _place(self, session: tuple, period: int, room: int) -> None:
+        teacher = self._teacher(session)
+        for other in self.blocks[period]:
+            self.room_load[(room, other)] += 1
+            self.free_rooms[other].discard(room)
+            if teacher:
+                self.teacher_load[(teacher, other)] += 1
+        self.occupant[(room, period)] = session
+        self.placement[session] = (period, room)
+        self.course_days[(session[0], self._day(period))] += 1
+
+    def _unplace(self, session: tuple) -> tuple:
+        period, room = self.placement.pop(session)
+        teacher = self._teacher(session)
+        for other in self.blocks[period]:
+            self.room_load[(room, other)] -= 1
+            if not self.room_load[(room, other)]:
+                self.free_rooms[other].add(room)
+            if teacher:
+                self.teacher_load[(teacher, other)] -= 1
+        del self.occupant[(room, period)]
+        self.course_days[(session[0], self._day(period))] -= 1
+        return period, room
+
+    def _teacher_free(self, session: tuple, period: int) -> bool:
+        teacher = self._teacher(session)
+        return not teacher or not self.teacher_load[(teacher, period)]
+
+    def _best_period(self, session: tuple) -> Optional[int]:
+        best, best_key = None, None
+        for period in self.periods:
+            if not self.free_rooms[period] or not self._teacher_free(session, period):
+                continue
+            key = (self.course_days[(session[0], self._day(period))], -len(self.free_rooms[period]))
+            if best_key is None or key < best_key:
+                best, best_key = period, key
+        return best
+
+    def _place_best(self, session: tuple) -> bool:
+        period = self._best_period(session)
+        if period is None:
+            return False
+        self._place(session, period, min(self.free_rooms[period]))
+        return True
+
+    def _place_by_ejection(self, session: tuple) -> bool:
+        """Free a room for ``session`` by moving the one session that holds it"""
+        if not any(self.free_rooms):
+            return False  # nowhere to move a blocking session to
+        periods = [period for period in self.periods if self._teacher_free(session, period)]
+        self.rng.shuffle(periods)
+        for period in periods:
+            for room in range(len(self.classrooms)):
+                if self.room_load[(room, period)] != 1:
+                    continue
+                blocker = next(
+                    (self.occupant[(room, other)] for other in self.blocks[period] if (room, other) in self.occupant),
+                    None,
+                )
+                if blocker is None:
+                    continue  # held by an existing schedule
+                origin = self._unplace(blocker)
+                self._place(session, period, room)
+                if self._place_best(blocker):
+                    return True
+                self._unplace(session)
+                self._place(blocker, *origin)
+        return False
+
+    def _spread(self, deadline: float) -> None:
+        """Move sessions off days their course already uses"""
+        for session in list(self.placement):
+            if time.monotonic() >= deadline:
+                return
+            period, _ = self.placement[session]
+            if self.course_days[(session[0], self._day(period))] < 2:
+                continue
+            origin = self._unplace(session)
+            target = self._best_period(session)
+            if target is not None and self.course_days[(session[0], self._day(target))] == 0:
+                self._place(session, target, min(self.free_rooms[target]))
+                self.stats["spread_moves"] += 1
+            else:
+                self._place(session, *origin)
+
+    def solve(self, time_budget: float) -> Dict[str, Any]:
+        started = time.monotonic()
+        deadline = started + time_budget
+        load: Dict[Optional[str], int] = defaultdict(int)
+        for session in self.sessions:
+            load[self._teacher(session)] += 1
+        order = sorted(self.sessions, key=lambda session: (-load[self._teacher(session)], session))
+        for session in order:
+            if self._place_best(session):
+                self.stats["greedy_placed"] += 1
+            else:
+                self.unplaced.append(session)
+
+        improved = True
+        while self.unplaced and improved and time.monotonic() < deadline:
+            improved = False
+            self.rng.shuffle(self.unplaced)
+            for session in list(self.unplaced):
+                if time.monotonic() >= deadline:
+                    break
+                if self._place_best(session) or self._place_by_ejection(session):
+                    self.unplaced.remove(session)
+                    self.stats["repaired"] += 1
+                    improved = True
+
+        self._spread(deadline)
+        return self.report(time.monotonic() - started)
+
+    def schedules(self) -> List[Dict[str, Any]]:
+        entries = []
+        for (course, _), (period, room) in sorted(self.placement.items()):
+            slot = self.slots[period % len(self.slots)]
+            entries.append({
+                "course_id": self.courses[course]["id"],
+                "day_of_week": self.days[self._day(period)],
+                "start_time": slot["start_time"],
+                "end_time": slot["end_time"],
+                "classroom": self.classrooms[room],
+                "start_minute": slot["start_minute"],
+                "end_minute": slot["end_minute"],
+                "teacher_id": self.courses[course].get("teacher_id"),
+            })
+        return entries
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        capacity = len(self.classrooms) * len(self.periods)
+        unscheduled = []
+        for course, number in sorted(self.unplaced):
+            session = (course, number)
+            teacher_busy = not any(self._teacher_free(session, period) for period in self.periods)
+            unscheduled.append({
+                "course_id": self.courses[course]["id"],
+                "code": self.courses[course].get("code"),
+                "session": number + 1,
+                "reason": "Teacher has no free period" if teacher_busy else "No free classroom",
+            })
+        return {
+            "sessions_requested": len(self.sessions),
+            "sessions_scheduled": len(self.placement),
+            "unscheduled": unscheduled,
+            "same_day_repeats": sum(count - 1 for count in self.course_days.values() if count > 1),
+            "room_utilization": round(len(self.placement) / capacity, 4) if capacity else 0.0,
+            "elapsed_seconds": round(elapsed, 3),
+            **self.stats,
+        }
+
+# Password hashing
+def bcrypt_hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def bcrypt_hash_many(passwords: List[str], rounds: int) -> List[str]:
+    """Hash a chunk of passwords in one call; runs in the import process pool"""
+    return [bcrypt_hash(password, rounds) for password in passwords]
+
+def timed_hash(request: RequestScope, func, *args):
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        request.hash_seconds += time.perf_counter() - started
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool so it never blocks the event loop.
+
+    Requests beyond the pool size wait in a queue of at most ``queue_limit``
+    entries; past that the caller gets a 503 instead of piling up latency.
+    """
+
+    def __init__(self, workers: int, queue_limit: int, rounds: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def _run(self, func, *args):
+        if self.pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        request = current_request.get()
+        if request is not None and request.profiling:
+            func = functools.partial(timed_hash, request, func)
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    def _hash(self, password: str) -> str:
+        return bcrypt_hash(password, self.rounds)
+
+    @staticmethod
+    def _verify(password: str, hashed: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self._verify, password, hashed)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+password_hasher = PasswordHasher(HASH_POOL_SIZE, HASH_QUEUE_LIMIT, BCRYPT_ROUNDS)
+
+# User imports
+# Imports run in the background of the worker that accepted them; their
+# progress is stored in db.import_jobs and expires after
+# IMPORT_JOB_RETENTION_SECONDS.
+_import_tasks = set()
+_import_pool: Optional[ProcessPoolExecutor] = None
+
+def get_import_pool() -> ProcessPoolExecutor:
+    # Created on first use so ordinary workers never start hashing processes.
+    # Spawned rather than forked: a fork would copy a process whose Motor and
+    # bcrypt threads may hold locks.
+    global _import_pool
+    if _import_pool is None:
+        _import_pool = ProcessPoolExecutor(
+            max_workers=IMPORT_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _import_pool
+
+async def run_user_import(job_id: str, users: List[tuple]) -> None:
+    """Hash passwords across the process pool and insert users as chunks complete"""
+    loop = asyncio.get_running_loop()
+    pool = get_import_pool()
+    chunks = [users[start:start + IMPORT_HASH_CHUNK] for start in range(0, len(users), IMPORT_HASH_CHUNK)]
+
+    async def hash_chunk(chunk):
+        passwords = [user.password for _, user in chunk]
+        return chunk, await loop.run_in_executor(pool, bcrypt_hash_many, passwords, BCRYPT_ROUNDS)
+
+    async def record(update: Dict[str, Any], errors: List[Dict[str, Any]]) -> None:
+        if errors:
+            update["$push"] = {"errors": {"$each": errors}}
+            update.setdefault("$inc", {})["failed"] = len(errors)
+        await db.import_jobs.update_one({"id": job_id}, update)
+
+    try:
+        for next_done in asyncio.as_completed([hash_chunk(chunk) for chunk in chunks]):
+            chunk, hashes = await next_done
+            docs = []
+            for (row_number, user_data), hashed_password in zip(chunk, hashes):
+                user_doc = User(**{**user_data.dict(), "password": hashed_password}).dict()
+                user_doc.update(build_search_index(user_doc, "users"))
+                docs.append((row_number, user_doc))
+            errors: List[Dict[str, Any]] = []
+            inserted = await insert_bulk(db.users, docs, errors)
+            await increment_counters(*(
+                (GLOBAL_COUNTERS, role_counter(doc["role"]), 1) for _, doc in inserted
+            ))
+            await record({"$inc": {"hashed": len(chunk), "inserted": len(inserted)}}, errors)
+        await record({"$set": {"status": "completed", "finished_at": datetime.utcnow()}}, [])
+    except Exception as exc:
+        logger.exception("User import %s failed", job_id)
+        await record(
+            {"$set": {"status": "failed", "finished_at": datetime.utcnow()}},
+            [{"row": None, "detail": str(exc)}],
+        )
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
 
-class GradeCreate(BaseModel):
-    student_id: str
-    course_id: str
-    exam_type: ExamType
-    score: float
-    max_score: float
-    exam_date: datetime
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_hasher.verify(password, hashed)
 
-class ExamProposal(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    teacher_id: str
-    course_id: str
-    exam_type: ExamType
-    title: str
-    description: str
-    proposed_date: datetime
-    duration_minutes: int
-    status: str = "pending"  # pending, approved, rejected
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+# Caching
+class TTLCache:
+    """Bounded LRU cache whose entries expire ``ttl`` seconds after being stored"""
 
-class ExamProposalCreate(BaseModel):
-    course_id: str
-    exam_type: ExamType
-    title: str
-    description: str
-    proposed_date: datetime
-    duration_minutes: int
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
 
-class Attendance(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    teacher_id: str
-    course_id: str
-    date: datetime
-    status: str = "present"  # present, absent
-    notes: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
 
-class AttendanceCreate(BaseModel):
-    course_id: str
-    date: datetime
-    status: str = "present"
-    notes: Optional[str] = None
+    def set(self, key, value) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
 
-# Utility functions
-def convert_objectid_to_str(doc):
-    """Convert MongoDB ObjectId to string for JSON serialization"""
-    if doc is None:
-        return None
-    if isinstance(doc, list):
-        return [convert_objectid_to_str(item) for item in doc]
-    if isinstance(doc, dict):
-        if '_id' in doc:
-            doc['_id'] = str(doc['_id'])
-        return doc
-    return doc
+    def invalidate(self, key) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+# Resolved users by id; never holds the password hash
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -231,26 +2889,72 @@ def create_access_token(data: dict) -> str:
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-            )
-        user = await db.users.find_one({"id": user_id})
+    return await authenticate(credentials.credentials)
+
+def _stream_token_key(token: str) -> str:
+    # Only a digest is stored, so the collection never holds usable tokens
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def create_stream_token(user_id: str) -> str:
+    token = secrets.token_urlsafe(32)
+    await db.stream_tokens.insert_one({
+        "_id": _stream_token_key(token),
+        "user_id": user_id,
+        "expires_at": datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_SECONDS),
+    })
+    return token
+
+async def get_stream_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    token: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Like get_current_user, but also takes a stream token as ``?token=``
+    since EventSource cannot set headers; each stream token works once"""
+    if credentials is not None:
+        return await authenticate(credentials.credentials)
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+        )
+    issued = await db.stream_tokens.find_one_and_delete({
+        "_id": _stream_token_key(token),
+        "expires_at": {"$gt": datetime.utcnow()},
+    })
+    if issued is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired stream token",
+        )
+    return await load_principal(issued["user_id"])
+
+async def load_principal(user_id: str) -> Dict[str, Any]:
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, {"password": 0, **HIDDEN_FIELDS})
         if user is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not found",
             )
-        return user
+        principal_cache.set(user_id, user)
+    return user
+
+async def authenticate(token: str) -> Dict[str, Any]:
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.PyJWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
         )
+    user_id = payload.get("user_id")
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+        )
+    return await load_principal(user_id)
 
 def require_role(allowed_roles: List[UserRole]):
     def role_checker(current_user: Dict[str, Any] = Depends(get_current_user)):
@@ -278,12 +2982,23 @@ async def register(user_data: UserCreate):
         )
     
     # Hash password and create user
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     user_dict = user_data.dict()
     user_dict["password"] = hashed_password
     user_obj = User(**user_dict)
     
-    await db.users.insert_one(user_obj.dict())
+    user_doc = user_obj.dict()
+    user_doc.update(build_search_index(user_doc, "users"))
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # A concurrent request registered the same email since the check above
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    await collection_versions.bump("users")
+    await increment_counters((GLOBAL_COUNTERS, role_counter(user_obj.role), 1))
     
     # Create access token
     access_token = create_access_token({"user_id": user_obj.id, "role": user_obj.role})
@@ -297,7 +3012,7 @@ async def register(user_data: UserCreate):
 @api_router.post("/auth/login")
 async def login(login_data: UserLogin):
     user = await db.users.find_one({"email": login_data.email})
-    if not user or not verify_password(login_data.password, user["password"]):
+    if not user or not await verify_password(login_data.password, user["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
@@ -319,45 +3034,50 @@ async def get_me(current_user: Dict[str, Any] = Depends(get_current_user)):
 @api_router.post("/courses")
 async def create_course(course_data: CourseCreate, current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
     course_obj = Course(**course_data.dict())
-    await db.courses.insert_one(course_obj.dict())
+    course_doc = course_obj.dict()
+    course_doc.update(build_search_index(course_doc, "courses"))
+    await db.courses.insert_one(course_doc)
+    await collection_versions.bump("courses")
+    await increment_counters(
+        (GLOBAL_COUNTERS, "courses", 1),
+        (teacher_counters(course_obj.teacher_id), "courses", 1),
+    )
     return course_obj
 
 @api_router.get("/courses")
 async def get_courses(
+    request: Request,
+    response: Response,
     search: Optional[str] = None,
     department: Optional[str] = None,
     teacher_id: Optional[str] = None,
     year: Optional[int] = None,
     semester: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
+    cached = not_modified(request, response, collection_versions.etag(request, current_user, "courses"))
+    if cached:
+        return cached
+    
     # Build query
     query = {}
     if department:
-        query["department"] = {"$regex": department, "$options": "i"}
+        query["department"] = {"$regex": re.escape(department), "$options": "i"}
     if teacher_id:
         query["teacher_id"] = teacher_id
     if year:
         query["year"] = year
     if semester:
-        query["semester"] = {"$regex": semester, "$options": "i"}
-    
-    # Search in name, code, and description
-    if search:
-        search_query = {
-            "$or": [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"code": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}}
-            ]
-        }
-        if query:
-            query = {"$and": [query, search_query]}
-        else:
-            query = search_query
+        query["semester"] = {"$regex": re.escape(semester), "$options": "i"}
     
-    courses = await db.courses.find(query).to_list(1000)
-    return [convert_objectid_to_str(course) for course in courses]
+    # Search in name, code, and description, ranked by relevance
+    if search and search.strip():
+        courses = await search_documents("courses", query, search, response, limit, cursor, COURSE_PROJECTION)
+    else:
+        courses = await fetch_page(db.courses, query, response, limit, cursor, COURSE_PROJECTION)
+    return json_response(courses, response)
 
 @api_router.put("/courses/{course_id}")
 async def update_course(
@@ -380,13 +3100,36 @@ async def update_course(
             detail="Can only update your own courses"
         )
     
+    # The course's sessions move to the new teacher, who must be free for them
+    if course_data.teacher_id != existing_course["teacher_id"]:
+        conflicts = []
+        schedules = db.schedules.find({"course_id": course_id, "start_minute": {"$exists": True}}, SCHEDULE_SLOT_PROJECTION)
+        async for schedule in schedules:
+            moved = {**schedule, "teacher_id": course_data.teacher_id}
+            for conflict in await find_schedule_conflicts(moved, exclude_id=schedule["id"], fields=("teacher_id",)):
+                conflicts.append({**conflict, "schedule_id": schedule["id"]})
+        reject_schedule_conflicts(conflicts)
+    
+    course_dict = course_data.dict()
+    course_dict.update(build_search_index(course_dict, "courses"))
     await db.courses.update_one(
         {"id": course_id},
-        {"$set": course_data.dict()}
+        {"$set": course_dict}
     )
+    if course_data.teacher_id != existing_course["teacher_id"]:
+        await increment_counters(
+            (teacher_counters(existing_course["teacher_id"]), "courses", -1),
+            (teacher_counters(course_data.teacher_id), "courses", 1),
+        )
+        await db.schedules.update_many(
+            {"course_id": course_id},
+            {"$set": {"teacher_id": course_data.teacher_id}}
+        )
+    await collection_versions.bump("courses")
+    await refresh_course_transcripts(course_id)
     
     # Return updated course
-    updated_course = await db.courses.find_one({"id": course_id})
+    updated_course = await db.courses.find_one({"id": course_id}, HIDDEN_FIELDS)
     return convert_objectid_to_str(updated_course)
 
 @api_router.delete("/courses/{course_id}")
@@ -394,72 +3137,160 @@ async def delete_course(
     course_id: str, 
     current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))
 ):
-    result = await db.courses.delete_one({"id": course_id})
-    if result.deleted_count == 0:
+    deleted_course = await db.courses.find_one_and_delete({"id": course_id})
+    if deleted_course is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Course not found"
         )
+    await collection_versions.bump("courses")
+    await increment_counters(
+        (GLOBAL_COUNTERS, "courses", -1),
+        (teacher_counters(deleted_course["teacher_id"]), "courses", -1),
+    )
+    await refresh_course_transcripts(course_id)
+    await invalidate_grade_stats([course_id])
     return {"message": "Course deleted successfully"}
 
 @api_router.get("/courses/my")
-async def get_my_courses(current_user: Dict[str, Any] = Depends(get_current_user)):
+async def get_my_courses(request: Request, response: Response, current_user: Dict[str, Any] = Depends(get_current_user)):
+    cached = not_modified(request, response, collection_versions.etag(request, current_user, "courses"))
+    if cached:
+        return cached
+    
     if current_user["role"] == UserRole.TEACHER:
-        courses = await db.courses.find({"teacher_id": current_user["id"]}).to_list(1000)
+        courses = await db.courses.find({"teacher_id": current_user["id"]}, COURSE_PROJECTION).to_list(1000)
     elif current_user["role"] == UserRole.STUDENT:
         # For students, we'll return all courses for now
-        courses = await db.courses.find().to_list(1000)
+        courses = await db.courses.find({}, COURSE_PROJECTION).to_list(1000)
     else:
-        courses = await db.courses.find().to_list(1000)
-    return [convert_objectid_to_str(course) for course in courses]
+        courses = await db.courses.find({}, COURSE_PROJECTION).to_list(1000)
+    return json_response(courses, response)
+
+@api_router.get("/courses/{course_id}/grade-stats")
+async def get_grade_stats(
+    course_id: str,
+    exam_type: Optional[ExamType] = None,
+    current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN, UserRole.TEACHER]))
+):
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "teacher_id": 1})
+    if not course:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course not found"
+        )
+    
+    # Teachers can only see statistics for their own courses
+    if current_user["role"] == UserRole.TEACHER and course["teacher_id"] != current_user["id"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Can only view statistics for your own courses"
+        )
+    
+    return await get_course_grade_stats(course_id, exam_type.value if exam_type else None)
 
 # Schedule Routes
 @api_router.post("/schedules")
 async def create_schedule(schedule_data: ScheduleCreate, current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
     schedule_obj = Schedule(**schedule_data.dict())
-    await db.schedules.insert_one(schedule_obj.dict())
+    schedule_doc = {**schedule_obj.dict(), **await schedule_placement(schedule_data)}
+    reject_schedule_conflicts(await find_schedule_conflicts(schedule_doc))
+    await db.schedules.insert_one(schedule_doc)
+    await collection_versions.bump("schedules")
     return schedule_obj
 
+@api_router.post("/schedules/generate")
+async def generate_timetable(
+    request_data: TimetableRequest,
+    current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))
+):
+    """Build a conflict-free timetable for a semester's courses, replacing their schedules"""
+    slots = [
+        {**slot.dict(), **schedule_slot(slot.start_time, slot.end_time)}
+        for slot in request_data.slots
+    ]
+    courses = await db.courses.find(
+        {"year": request_data.year, "semester": request_data.semester},
+        {"_id": 0, "id": 1, "code": 1, "teacher_id": 1}
+    ).sort("id", ASCENDING).to_list(None)
+    course_ids = [course["id"] for course in courses]
+    
+    solver = TimetableSolver(
+        courses, request_data.classrooms, request_data.days, slots,
+        request_data.sessions_per_course, request_data.seed
+    )
+    # Other semesters' schedules keep their rooms and teachers
+    existing = db.schedules.find(
+        {"course_id": {"$nin": course_ids}, "day_of_week": {"$in": request_data.days}, "start_minute": {"$exists": True}},
+        SCHEDULE_SLOT_PROJECTION
+    )
+    async for entry in existing:
+        solver.block(entry)
+    
+    report = await asyncio.to_thread(solver.solve, request_data.time_budget_seconds)
+    schedules = [{**Schedule(**entry).dict(), **entry} for entry in solver.schedules()]
+    
+    if not request_data.dry_run:
+        await db.schedules.delete_many({"course_id": {"$in": course_ids}})
+        for start in range(0, len(schedules), EXPORT_BATCH_SIZE):
+            await db.schedules.insert_many([dict(entry) for entry in schedules[start:start + EXPORT_BATCH_SIZE]])
+        await collection_versions.bump("schedules")
+    
+    return {"report": report, "dry_run": request_data.dry_run, "schedules": schedules}
+
+@api_router.get("/schedules/conflicts")
+async def get_schedule_conflicts(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    entries = await db.schedules.find(
+        {"start_minute": {"$exists": True}}, SCHEDULE_SLOT_PROJECTION
+    ).to_list(None)
+    classroom_conflicts = sweep_overlaps(entries, "classroom")
+    teacher_conflicts = sweep_overlaps(entries, "teacher_id")
+    return {
+        "checked": len(entries),
+        "conflict_count": len(classroom_conflicts) + len(teacher_conflicts),
+        "classroom_conflicts": classroom_conflicts,
+        "teacher_conflicts": teacher_conflicts,
+    }
+
 @api_router.get("/schedules")
 async def get_schedules(
+    request: Request,
+    response: Response,
     search: Optional[str] = None,
     day_of_week: Optional[str] = None,
     classroom: Optional[str] = None,
     course_id: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
+    cached = not_modified(request, response, collection_versions.etag(request, current_user, "schedules", "courses"))
+    if cached:
+        return cached
+    
     # Build query
     query = {}
     if day_of_week:
-        query["day_of_week"] = {"$regex": day_of_week, "$options": "i"}
+        query["day_of_week"] = {"$regex": re.escape(day_of_week), "$options": "i"}
     if classroom:
-        query["classroom"] = {"$regex": classroom, "$options": "i"}
+        query["classroom"] = {"$regex": re.escape(classroom), "$options": "i"}
     if course_id:
         query["course_id"] = course_id
     
-    schedules = await db.schedules.find(query).to_list(1000)
+    # Search in course, classroom and day, resolved to indexed values up front
+    if search and search.strip():
+        query = and_query(query, {
+            "$or": [
+                {"course_id": {"$in": await matching_ids("courses", search)}},
+                {"classroom": {"$in": await matching_values(db.schedules, "classroom", search)}},
+                {"day_of_week": {"$in": await matching_values(db.schedules, "day_of_week", search)}},
+            ]
+        })
     
-    # Enrich with course information and apply search
-    enriched_schedules = []
-    for schedule in schedules:
-        schedule = convert_objectid_to_str(schedule)
-        course = await db.courses.find_one({"id": schedule["course_id"]})
-        schedule["course"] = convert_objectid_to_str(course)
-        
-        # Apply search filter
-        if search:
-            course_name = course["name"].lower() if course else ""
-            classroom_name = schedule["classroom"].lower()
-            day_name = schedule["day_of_week"].lower()
-            
-            if (search.lower() in course_name or 
-                search.lower() in classroom_name or 
-                search.lower() in day_name):
-                enriched_schedules.append(schedule)
-        else:
-            enriched_schedules.append(schedule)
+    schedules = await fetch_page(db.schedules, query, response, limit, cursor, SCHEDULE_PROJECTION)
     
-    return enriched_schedules
+    # Enrich with course information
+    return json_response(await attach_related(schedules, course=("course_id", db.courses)), response)
 
 @api_router.put("/schedules/{schedule_id}")
 async def update_schedule(
@@ -475,14 +3306,17 @@ async def update_schedule(
             detail="Schedule not found"
         )
     
+    schedule_dict = {**schedule_data.dict(), **await schedule_placement(schedule_data)}
+    reject_schedule_conflicts(await find_schedule_conflicts(schedule_dict, exclude_id=schedule_id))
+    
     await db.schedules.update_one(
         {"id": schedule_id},
-        {"$set": schedule_data.dict()}
+        {"$set": schedule_dict}
     )
+    await collection_versions.bump("schedules")
     
     # Return updated schedule
-    updated_schedule = await db.schedules.find_one({"id": schedule_id})
-    return convert_objectid_to_str(updated_schedule)
+    return await db.schedules.find_one({"id": schedule_id}, SCHEDULE_PROJECTION)
 
 @api_router.delete("/schedules/{schedule_id}")
 async def delete_schedule(
@@ -495,6 +3329,7 @@ async def delete_schedule(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Schedule not found"
         )
+    await collection_versions.bump("schedules")
     return {"message": "Schedule deleted successfully"}
 
 # Grade Routes
@@ -502,16 +3337,61 @@ async def delete_schedule(
 async def create_grade(grade_data: GradeCreate, current_user: Dict[str, Any] = Depends(require_role([UserRole.TEACHER, UserRole.ADMIN]))):
     grade_obj = Grade(**grade_data.dict())
     await db.grades.insert_one(grade_obj.dict())
+    await collection_versions.bump("grades")
+    await increment_counters((student_counters(grade_obj.student_id), "grades", 1))
+    await refresh_transcripts([grade_obj.student_id])
+    await invalidate_grade_stats([grade_obj.course_id])
+    event_broker.publish([grade_obj.student_id], grade_event("grade.created", grade_obj.dict()))
     return grade_obj
 
+@api_router.post("/grades/bulk")
+async def create_grades_bulk(request: Request, current_user: Dict[str, Any] = Depends(require_role([UserRole.TEACHER, UserRole.ADMIN]))):
+    errors: List[Dict[str, Any]] = []
+    grades = parse_bulk_rows(await read_bulk_rows(request), GradeCreate, errors)
+    
+    # Resolve every referenced course and student with one query each
+    courses = await fetch_by_ids(db.courses, (g.course_id for _, g in grades), {"_id": 0, "id": 1, "teacher_id": 1})
+    students = await fetch_by_ids(db.users, (g.student_id for _, g in grades), {"_id": 0, "id": 1, "role": 1})
+    
+    valid = []
+    for row_number, grade in grades:
+        course = courses.get(grade.course_id)
+        student = students.get(grade.student_id)
+        if course is None:
+            errors.append({"row": row_number, "detail": "Course not found"})
+        elif current_user["role"] == UserRole.TEACHER and course["teacher_id"] != current_user["id"]:
+            errors.append({"row": row_number, "detail": "Can only add grades for your own courses"})
+        elif student is None or student["role"] != UserRole.STUDENT:
+            errors.append({"row": row_number, "detail": "Student not found"})
+        else:
+            valid.append((row_number, Grade(**grade.dict()).dict()))
+    
+    inserted = await insert_bulk(db.grades, valid, errors)
+    await increment_counters(*(
+        (student_counters(doc["student_id"]), "grades", 1) for _, doc in inserted
+    ))
+    await refresh_transcripts(doc["student_id"] for _, doc in inserted)
+    await invalidate_grade_stats(doc["course_id"] for _, doc in inserted)
+    for _, doc in inserted:
+        event_broker.publish([doc["student_id"]], grade_event("grade.created", doc))
+    return bulk_report(len(inserted), errors)
+
 @api_router.get("/grades")
 async def get_all_grades(
+    request: Request,
+    response: Response,
     search: Optional[str] = None,
     course_id: Optional[str] = None,
     student_id: Optional[str] = None,
     exam_type: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN, UserRole.TEACHER]))
 ):
+    cached = not_modified(request, response, collection_versions.etag(request, current_user, "grades", "courses", "users"))
+    if cached:
+        return cached
+    
     # Build query
     query = {}
     if course_id:
@@ -523,37 +3403,30 @@ async def get_all_grades(
     
     # Teachers can only see grades for their courses
     if current_user["role"] == UserRole.TEACHER:
-        teacher_courses = await db.courses.find({"teacher_id": current_user["id"]}).to_list(1000)
-        teacher_course_ids = [course["id"] for course in teacher_courses]
+        teacher_course_ids = await db.courses.distinct("id", {"teacher_id": current_user["id"]})
         if query.get("course_id"):
             if query["course_id"] not in teacher_course_ids:
                 return []
         else:
             query["course_id"] = {"$in": teacher_course_ids}
     
-    grades = await db.grades.find(query).to_list(1000)
+    # Search in course and student names, resolved to ids up front
+    if search and search.strip():
+        query = and_query(query, {
+            "$or": [
+                {"course_id": {"$in": await matching_ids("courses", search)}},
+                {"student_id": {"$in": await matching_ids("users", search, {"role": UserRole.STUDENT})}},
+            ]
+        })
     
-    # Enrich with course and student information
-    enriched_grades = []
-    for grade in grades:
-        grade = convert_objectid_to_str(grade)
-        course = await db.courses.find_one({"id": grade["course_id"]})
-        student = await db.users.find_one({"id": grade["student_id"]})
-        grade["course"] = convert_objectid_to_str(course)
-        grade["student"] = convert_objectid_to_str(student) if student else None
-        
-        # Apply search filter
-        if search:
-            course_name = course["name"].lower() if course else ""
-            student_name = f"{student['first_name']} {student['last_name']}".lower() if student else ""
-            
-            if (search.lower() in course_name or 
-                search.lower() in student_name):
-                enriched_grades.append(grade)
-        else:
-            enriched_grades.append(grade)
+    grades = await fetch_page(db.grades, query, response, limit, cursor, GRADE_PROJECTION)
     
-    return enriched_grades
+    # Enrich with course and student information
+    return json_response(await attach_related(
+        grades,
+        course=("course_id", db.courses),
+        student=("student_id", db.users),
+    ), response)
 
 @api_router.put("/grades/{grade_id}")
 async def update_grade(
@@ -582,9 +3455,21 @@ async def update_grade(
         {"id": grade_id},
         {"$set": grade_data.dict()}
     )
+    await collection_versions.bump("grades")
+    if grade_data.student_id != existing_grade["student_id"]:
+        await increment_counters(
+            (student_counters(existing_grade["student_id"]), "grades", -1),
+            (student_counters(grade_data.student_id), "grades", 1),
+        )
+    await refresh_transcripts([existing_grade["student_id"], grade_data.student_id])
+    await invalidate_grade_stats([existing_grade["course_id"], grade_data.course_id])
     
     # Return updated grade
     updated_grade = await db.grades.find_one({"id": grade_id})
+    event_broker.publish(
+        [existing_grade["student_id"], grade_data.student_id],
+        grade_event("grade.updated", updated_grade),
+    )
     return convert_objectid_to_str(updated_grade)
 
 @api_router.delete("/grades/{grade_id}")
@@ -610,21 +3495,55 @@ async def delete_grade(
             )
     
     await db.grades.delete_one({"id": grade_id})
+    await collection_versions.bump("grades")
+    await increment_counters((student_counters(existing_grade["student_id"]), "grades", -1))
+    await refresh_transcripts([existing_grade["student_id"]])
+    await invalidate_grade_stats([existing_grade["course_id"]])
     return {"message": "Grade deleted successfully"}
 
 @api_router.get("/grades/my")
-async def get_my_grades(current_user: Dict[str, Any] = Depends(get_current_user)):
+async def get_my_grades(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    cached = not_modified(request, response, collection_versions.etag(request, current_user, "grades", "courses"))
+    if cached:
+        return cached
+    
     if current_user["role"] == UserRole.STUDENT:
-        grades = await db.grades.find({"student_id": current_user["id"]}).to_list(1000)
+        query = {"student_id": current_user["id"]}
     else:
-        grades = await db.grades.find().to_list(1000)
+        query = {}
+    grades = await fetch_page(db.grades, query, response, limit, cursor, GRADE_PROJECTION)
     
     # Enrich with course information
-    for grade in grades:
-        grade = convert_objectid_to_str(grade)
-        course = await db.courses.find_one({"id": grade["course_id"]})
-        grade["course"] = convert_objectid_to_str(course)
-    return grades
+    return json_response(await attach_related(grades, course=("course_id", db.courses)), response)
+
+# Transcript Routes
+async def read_transcript(student_id: str) -> Dict[str, Any]:
+    transcript = await db.transcripts.find_one({"_id": student_id}, TRANSCRIPT_PROJECTION)
+    if transcript is None:
+        # Students graded before transcripts existed are built on first read
+        await refresh_transcripts([student_id])
+        transcript = await db.transcripts.find_one({"_id": student_id}, TRANSCRIPT_PROJECTION)
+    return transcript
+
+@api_router.get("/transcripts/me")
+async def get_my_transcript(current_user: Dict[str, Any] = Depends(require_role([UserRole.STUDENT]))):
+    return await read_transcript(current_user["id"])
+
+@api_router.get("/transcripts/{student_id}")
+async def get_transcript(student_id: str, current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    student = await db.users.find_one({"id": student_id, "role": UserRole.STUDENT}, {"_id": 1})
+    if student is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Student not found"
+        )
+    return await read_transcript(student_id)
 
 # Exam Proposal Routes
 @api_router.post("/exam-proposals")
@@ -632,31 +3551,109 @@ async def create_exam_proposal(proposal_data: ExamProposalCreate, current_user:
     proposal_dict = proposal_data.dict()
     proposal_dict["teacher_id"] = current_user["id"]
     proposal_obj = ExamProposal(**proposal_dict)
-    await db.exam_proposals.insert_one(proposal_obj.dict())
+    course = await db.courses.find_one({"id": proposal_obj.course_id}, {"_id": 0, "department": 1})
+    proposal_doc = {**proposal_obj.dict(), **exam_slot(proposal_dict, course)}
+    reject_exam_clashes(await find_exam_clashes(proposal_doc))
+    await db.exam_proposals.insert_one(proposal_doc)
+    await collection_versions.bump("exam_proposals")
+    await increment_counters(
+        (GLOBAL_COUNTERS, "pending_proposals", 1),
+        (teacher_counters(proposal_obj.teacher_id), "proposals", 1),
+    )
     return proposal_obj
 
 @api_router.get("/exam-proposals")
-async def get_exam_proposals(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN, UserRole.TEACHER]))):
+async def get_exam_proposals(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN, UserRole.TEACHER]))
+):
+    cached = not_modified(request, response, collection_versions.etag(request, current_user, "exam_proposals", "courses", "users"))
+    if cached:
+        return cached
+    
     if current_user["role"] == UserRole.TEACHER:
-        proposals = await db.exam_proposals.find({"teacher_id": current_user["id"]}).to_list(1000)
+        query = {"teacher_id": current_user["id"]}
     else:
-        proposals = await db.exam_proposals.find().to_list(1000)
+        query = {}
+    proposals = await fetch_page(db.exam_proposals, query, response, limit, cursor, EXAM_PROPOSAL_PROJECTION)
     
     # Enrich with course and teacher information
-    for proposal in proposals:
-        proposal = convert_objectid_to_str(proposal)
-        course = await db.courses.find_one({"id": proposal["course_id"]})
-        teacher = await db.users.find_one({"id": proposal["teacher_id"]})
-        proposal["course"] = convert_objectid_to_str(course)
-        proposal["teacher"] = convert_objectid_to_str(teacher)
-    return proposals
+    return json_response(await attach_related(
+        proposals,
+        course=("course_id", db.courses),
+        teacher=("teacher_id", db.users),
+    ), response)
+
+@api_router.post("/exam-proposals/approve-pending")
+async def approve_pending_exam_proposals(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    """Approve every pending proposal that clashes with no approved exam, first come first served"""
+    pending = await db.exam_proposals.find({"status": "pending"}, EXAM_CLASH_PROJECTION).to_list(None)
+    pending.sort(key=lambda proposal: (proposal["created_at"], proposal["id"]))
+    
+    index = ExamIntervalIndex()
+    if pending:
+        window = {
+            "$gt": min(p["proposed_date"] for p in pending) - timedelta(minutes=MAX_EXAM_MINUTES),
+            "$lt": max(p["ends_at"] for p in pending),
+        }
+        async for exam in db.exam_proposals.find({"status": "approved", "proposed_date": window}, EXAM_CLASH_PROJECTION):
+            index.add(exam)
+    
+    approved_ids, skipped = [], []
+    for proposal in pending:
+        clashes = index.clashes(proposal)
+        if clashes:
+            skipped.append({"id": proposal["id"], "title": proposal["title"], "clashes": clashes})
+        else:
+            index.add(proposal)
+            approved_ids.append(proposal["id"])
+    
+    approved = 0
+    for start in range(0, len(approved_ids), EXPORT_BATCH_SIZE):
+        result = await db.exam_proposals.update_many(
+            {"id": {"$in": approved_ids[start:start + EXPORT_BATCH_SIZE]}, "status": "pending"},
+            {"$set": {"status": "approved"}}
+        )
+        approved += result.modified_count
+    if approved:
+        await collection_versions.bump("exam_proposals")
+        approved_set = set(approved_ids)
+        for proposal in pending:
+            if proposal["id"] in approved_set:
+                event_broker.publish([proposal["teacher_id"]], {
+                    "type": "exam_proposal.status",
+                    "proposal_id": proposal["id"],
+                    "course_id": proposal["course_id"],
+                    "status": "approved",
+                })
+        await increment_counters((GLOBAL_COUNTERS, "pending_proposals", -approved))
+    return {"approved": approved, "approved_ids": approved_ids, "skipped": skipped}
 
 @api_router.put("/exam-proposals/{proposal_id}/status")
 async def update_exam_proposal_status(proposal_id: str, status: str, current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
-    await db.exam_proposals.update_one(
+    if status == "approved":
+        proposal = await db.exam_proposals.find_one({"id": proposal_id}, EXAM_CLASH_PROJECTION)
+        if proposal and proposal.get("clash_keys"):
+            reject_exam_clashes(await find_exam_clashes(proposal, ["approved"], exclude_id=proposal_id))
+    previous = await db.exam_proposals.find_one_and_update(
         {"id": proposal_id},
         {"$set": {"status": status}}
     )
+    if previous is not None:
+        await collection_versions.bump("exam_proposals")
+        was_pending = previous["status"] == "pending"
+        is_pending = status == "pending"
+        if was_pending != is_pending:
+            await increment_counters((GLOBAL_COUNTERS, "pending_proposals", 1 if is_pending else -1))
+        event_broker.publish([previous["teacher_id"]], {
+            "type": "exam_proposal.status",
+            "proposal_id": proposal_id,
+            "course_id": previous["course_id"],
+            "status": status,
+        })
     return {"message": "Status updated successfully"}
 
 # Attendance Routes
@@ -666,27 +3663,153 @@ async def mark_attendance(attendance_data: AttendanceCreate, current_user: Dict[
     attendance_dict["teacher_id"] = current_user["id"]
     attendance_obj = Attendance(**attendance_dict)
     await db.attendance.insert_one(attendance_obj.dict())
+    await collection_versions.bump("attendance")
+    await record_attendance([attendance_dict])
     return attendance_obj
 
 @api_router.get("/attendance")
-async def get_attendance(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN, UserRole.TEACHER]))):
+async def get_attendance(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN, UserRole.TEACHER]))
+):
+    cached = not_modified(request, response, collection_versions.etag(request, current_user, "attendance", "courses", "users"))
+    if cached:
+        return cached
+    
     if current_user["role"] == UserRole.TEACHER:
-        attendance = await db.attendance.find({"teacher_id": current_user["id"]}).to_list(1000)
+        query = {"teacher_id": current_user["id"]}
     else:
-        attendance = await db.attendance.find().to_list(1000)
+        query = {}
+    attendance = await fetch_page(db.attendance, query, response, limit, cursor, ATTENDANCE_PROJECTION)
     
     # Enrich with course and teacher information
-    for record in attendance:
-        record = convert_objectid_to_str(record)
-        course = await db.courses.find_one({"id": record["course_id"]})
-        teacher = await db.users.find_one({"id": record["teacher_id"]})
-        record["course"] = convert_objectid_to_str(course)
-        record["teacher"] = convert_objectid_to_str(teacher)
-    return attendance
+    return json_response(await attach_related(
+        attendance,
+        course=("course_id", db.courses),
+        teacher=("teacher_id", db.users),
+    ), response)
+
+@api_router.get("/attendance/analytics/courses/{course_id}")
+async def get_course_attendance_trend(
+    course_id: str,
+    granularity: str = Query("week", pattern="^(day|week)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN, UserRole.TEACHER]))
+):
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "teacher_id": 1})
+    if not course:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course not found"
+        )
+    
+    # Teachers can only see attendance for their own courses
+    if current_user["role"] == UserRole.TEACHER and course["teacher_id"] != current_user["id"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Can only view attendance for your own courses"
+        )
+    
+    query = {"course_id": course_id, "period": granularity}
+    if start or end:
+        query["period_start"] = {}
+        if start:
+            query["period_start"]["$gte"] = rollup_period_start(start, granularity)
+        if end:
+            query["period_start"]["$lte"] = as_naive_utc(end)
+    rollups = await db.attendance_rollups.find(query, ROLLUP_PROJECTION).sort("period_start", ASCENDING).to_list(None)
+    
+    totals = {"present": 0, "absent": 0, "total": 0}
+    series = []
+    for rollup in rollups:
+        for field in totals:
+            totals[field] += rollup[field]
+        series.append({
+            "period_start": rollup["period_start"],
+            "present": rollup["present"],
+            "absent": rollup["absent"],
+            "total": rollup["total"],
+            "rate": attendance_rate(rollup),
+        })
+    return {
+        "course_id": course_id,
+        "granularity": granularity,
+        "series": series,
+        "totals": {**totals, "rate": attendance_rate(totals)},
+    }
+
+@api_router.get("/attendance/analytics/summary")
+async def get_attendance_summary(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN, UserRole.TEACHER]))
+):
+    """Attendance totals per course over a date range, lowest rate first"""
+    match: Dict[str, Any] = {"period": "day"}
+    if start or end:
+        match["period_start"] = {}
+        if start:
+            match["period_start"]["$gte"] = rollup_period_start(start, "day")
+        if end:
+            match["period_start"]["$lte"] = as_naive_utc(end)
+    if current_user["role"] == UserRole.TEACHER:
+        match["course_id"] = {"$in": await db.courses.distinct("id", {"teacher_id": current_user["id"]})}
+    
+    rows = await db.attendance_rollups.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": "$course_id",
+            "present": {"$sum": "$present"},
+            "absent": {"$sum": "$absent"},
+            "total": {"$sum": "$total"},
+        }},
+    ]).to_list(None)
+    courses = await fetch_by_ids(db.courses, (row["_id"] for row in rows), COURSE_NAME_PROJECTION)
+    
+    summary = []
+    for row in rows:
+        course = courses.get(row["_id"], {})
+        summary.append({
+            "course_id": row["_id"],
+            "course_code": course.get("code"),
+            "course_name": course.get("name"),
+            "present": row["present"],
+            "absent": row["absent"],
+            "total": row["total"],
+            "rate": attendance_rate(row),
+        })
+    summary.sort(key=lambda row: (row["rate"] is None, row["rate"] or 0, row["course_id"]))
+    return summary
+
+# Event Routes
+@api_router.post("/events/token")
+async def issue_stream_token(current_user: Dict[str, Any] = Depends(get_current_user)):
+    """A single-use token for opening ``/events?token=`` from an EventSource"""
+    return {"token": await create_stream_token(current_user["id"]), "expires_in": STREAM_TOKEN_SECONDS}
+
+@api_router.get("/events")
+async def stream_events(request: Request, current_user: Dict[str, Any] = Depends(get_stream_user)):
+    """Server-Sent Events of grade and exam proposal changes concerning the caller"""
+    queue = event_broker.subscribe(current_user["id"])
+    return StreamingResponse(
+        event_stream(request, current_user["id"], queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/admin/events")
+async def get_event_stats(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    return event_broker.stats()
 
 # Admin Routes
 @api_router.get("/admin/users")
 async def get_all_users(
+    request: Request,
+    response: Response,
     search: Optional[str] = None,
     role: Optional[str] = None,
     status: Optional[str] = None,
@@ -694,8 +3817,14 @@ async def get_all_users(
     level: Optional[str] = None,
     field_of_study: Optional[str] = None,
     specialty: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))
 ):
+    cached = not_modified(request, response, collection_versions.etag(request, current_user, "users"))
+    if cached:
+        return cached
+    
     # Build query
     query = {}
     if role:
@@ -703,31 +3832,20 @@ async def get_all_users(
     if status:
         query["status"] = status
     if department:
-        query["department"] = {"$regex": department, "$options": "i"}
+        query["department"] = {"$regex": re.escape(department), "$options": "i"}
     if level:
         query["level"] = level
     if field_of_study:
-        query["field_of_study"] = {"$regex": field_of_study, "$options": "i"}
+        query["field_of_study"] = {"$regex": re.escape(field_of_study), "$options": "i"}
     if specialty:
-        query["specialty"] = {"$regex": specialty, "$options": "i"}
-    
-    # Search in name and email
-    if search:
-        search_query = {
-            "$or": [
-                {"first_name": {"$regex": search, "$options": "i"}},
-                {"last_name": {"$regex": search, "$options": "i"}},
-                {"email": {"$regex": search, "$options": "i"}},
-                {"student_id": {"$regex": search, "$options": "i"}}
-            ]
-        }
-        if query:
-            query = {"$and": [query, search_query]}
-        else:
-            query = search_query
+        query["specialty"] = {"$regex": re.escape(specialty), "$options": "i"}
     
-    users = await db.users.find(query).to_list(1000)
-    return [UserResponse(**convert_objectid_to_str(user)) for user in users]
+    # Search in name, email and student number, ranked by relevance
+    if search and search.strip():
+        users = await search_documents("users", query, search, response, limit, cursor, USER_RESPONSE_PROJECTION)
+    else:
+        users = await fetch_page(db.users, query, response, limit, cursor, USER_RESPONSE_PROJECTION)
+    return json_response(trusted_users(users), response)
 
 @api_router.post("/admin/users")
 async def create_user(user_data: UserCreate, current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
@@ -740,14 +3858,72 @@ async def create_user(user_data: UserCreate, current_user: Dict[str, Any] = Depe
         )
     
     # Hash password and create user
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     user_dict = user_data.dict()
     user_dict["password"] = hashed_password
     user_obj = User(**user_dict)
     
-    await db.users.insert_one(user_obj.dict())
+    user_doc = user_obj.dict()
+    user_doc.update(build_search_index(user_doc, "users"))
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # A concurrent request registered the same email since the check above
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    await collection_versions.bump("users")
+    await increment_counters((GLOBAL_COUNTERS, role_counter(user_obj.role), 1))
     return UserResponse(**user_obj.dict())
 
+@api_router.post("/admin/users/import", status_code=status.HTTP_202_ACCEPTED)
+async def import_users(request: Request, current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    rows = await read_bulk_rows(request)
+    errors: List[Dict[str, Any]] = []
+    users = parse_bulk_rows(rows, UserCreate, errors)
+    
+    # Email uniqueness against the file itself and the database, in one query
+    registered = set(await db.users.distinct("email", {"email": {"$in": [u.email for _, u in users]}}))
+    seen = set()
+    accepted = []
+    for row_number, user_data in users:
+        if user_data.email in registered:
+            errors.append({"row": row_number, "detail": "Email already registered"})
+        elif user_data.email in seen:
+            errors.append({"row": row_number, "detail": "Duplicate email in import"})
+        else:
+            seen.add(user_data.email)
+            accepted.append((row_number, user_data))
+    
+    job = {
+        "id": str(uuid.uuid4()),
+        "status": "running",
+        "total": len(rows),
+        "hashed": 0,
+        "inserted": 0,
+        "failed": len(errors),
+        "errors": errors,
+        "started_at": datetime.utcnow(),
+        "finished_at": None,
+    }
+    await db.import_jobs.insert_one(dict(job))
+    
+    task = asyncio.create_task(run_user_import(job["id"], accepted))
+    _import_tasks.add(task)
+    task.add_done_callback(_import_tasks.discard)
+    return job
+
+@api_router.get("/admin/users/import/{job_id}")
+async def get_import_job(job_id: str, current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    job = await db.import_jobs.find_one({"id": job_id}, {"_id": 0})
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Import job not found"
+        )
+    return job
+
 @api_router.put("/admin/users/{user_id}")
 async def update_user(
     user_id: str, 
@@ -766,10 +3942,13 @@ async def update_user(
     update_data = {k: v for k, v in user_data.dict().items() if v is not None}
     
     if update_data:
+        update_data.update(build_search_index({**existing_user, **update_data}, "users"))
         await db.users.update_one(
             {"id": user_id},
             {"$set": update_data}
         )
+        principal_cache.invalidate(user_id)
+        await collection_versions.bump("users")
     
     # Return updated user
     updated_user = await db.users.find_one({"id": user_id})
@@ -777,51 +3956,210 @@ async def update_user(
 
 @api_router.delete("/admin/users/{user_id}")
 async def delete_user(user_id: str, current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
-    await db.users.delete_one({"id": user_id})
+    deleted_user = await db.users.find_one_and_delete({"id": user_id})
+    principal_cache.invalidate(user_id)
+    if deleted_user is not None:
+        await collection_versions.bump("users")
+        await increment_counters((GLOBAL_COUNTERS, role_counter(deleted_user["role"]), -1))
+        await db.transcripts.delete_one({"_id": user_id})
     return {"message": "User deleted successfully"}
 
+@api_router.get("/admin/export/{collection_name}")
+async def export_collection(
+    collection_name: str,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))
+):
+    if collection_name not in EXPORT_COLUMNS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown export"
+        )
+    
+    if export_format == "csv":
+        body, media_type = stream_csv(collection_name), "text/csv"
+    else:
+        body, media_type = stream_ndjson(collection_name), "application/x-ndjson"
+    filename = f"{collection_name}-{datetime.utcnow():%Y%m%d}.{export_format}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@api_router.get("/admin/cache")
+async def get_cache_stats(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    return {"principals": principal_cache.stats()}
+
+@api_router.get("/admin/indexes")
+async def get_index_report(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    collections = {}
+    for collection_name in INDEXES:
+        indexes = await db[collection_name].index_information()
+        collections[collection_name] = sorted(indexes)
+
+    queries = []
+    for collection_name, query in QUERY_SHAPES:
+        plan = await explain_query(collection_name, query)
+        queries.append({"collection": collection_name, "filter": query, **plan})
+
+    return {
+        "indexes": collections,
+        "queries": queries,
+        "collection_scans": [q for q in queries if q["collection_scan"]],
+    }
+
+# Slow query routes
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=SLOW_QUERY_LOG_SIZE),
+    collection: Optional[str] = None,
+    route: Optional[str] = None,
+    collection_scans: bool = False,
+    current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))
+):
+    """Commands slower than the threshold seen by this worker, newest first"""
+    entries = slow_queries.snapshot()
+    if collection:
+        entries = [e for e in entries if e["collection"] == collection]
+    if route:
+        entries = [e for e in entries if e["route"] == route]
+    if collection_scans:
+        entries = [e for e in entries if (e["explain"] or {}).get("collection_scan")]
+    return {
+        "threshold_ms": slow_queries.threshold_ms,
+        "capacity": slow_queries.entries.maxlen,
+        "recorded": slow_queries.recorded,
+        "entries": entries[:limit],
+    }
+
+@api_router.delete("/admin/slow-queries")
+async def clear_slow_queries(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    slow_queries.clear()
+    return {"message": "Slow query log cleared"}
+
 # Dashboard stats
 @api_router.get("/stats")
 async def get_stats(current_user: Dict[str, Any] = Depends(get_current_user)):
     if current_user["role"] == UserRole.ADMIN:
-        total_students = await db.users.count_documents({"role": "student"})
-        total_teachers = await db.users.count_documents({"role": "teacher"})
-        total_courses = await db.courses.count_documents({})
-        pending_proposals = await db.exam_proposals.count_documents({"status": "pending"})
+        totals = await db.stats.find_one({"_id": GLOBAL_COUNTERS}) or {}
         
         return {
-            "total_students": total_students,
-            "total_teachers": total_teachers,
-            "total_courses": total_courses,
-            "pending_proposals": pending_proposals
+            "total_students": totals.get("students", 0),
+            "total_teachers": totals.get("teachers", 0),
+            "total_courses": totals.get("courses", 0),
+            "pending_proposals": totals.get("pending_proposals", 0)
         }
     elif current_user["role"] == UserRole.TEACHER:
-        my_courses = await db.courses.count_documents({"teacher_id": current_user["id"]})
-        my_proposals = await db.exam_proposals.count_documents({"teacher_id": current_user["id"]})
+        mine = await db.stats.find_one({"_id": teacher_counters(current_user["id"])}) or {}
         
         return {
-            "my_courses": my_courses,
-            "my_proposals": my_proposals
+            "my_courses": mine.get("courses", 0),
+            "my_proposals": mine.get("proposals", 0)
         }
     else:  # Student
-        my_grades = await db.grades.count_documents({"student_id": current_user["id"]})
-        total_courses = await db.courses.count_documents({})
+        keys = [GLOBAL_COUNTERS, student_counters(current_user["id"])]
+        counters = {doc["_id"]: doc for doc in await db.stats.find({"_id": {"$in": keys}}).to_list(2)}
         
         return {
-            "my_grades": my_grades,
-            "available_courses": total_courses
+            "my_grades": counters.get(keys[1], {}).get("grades", 0),
+            "available_courses": counters.get(GLOBAL_COUNTERS, {}).get("courses", 0)
         }
 
+@api_router.post("/admin/stats/reconcile")
+async def reconcile_stats(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    await reconcile_counters()
+    return {"message": "Counters reconciled"}
+
+@api_router.post("/admin/attendance/rollups/rebuild", status_code=status.HTTP_202_ACCEPTED)
+async def rebuild_attendance_stats(current_user: Dict[str, Any] = Depends(require_role([UserRole.ADMIN]))):
+    if not start_rollup_rebuild():
+        return {"message": "Attendance rollup rebuild already running"}
+    return {"message": "Attendance rollup rebuild started"}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ping_ms = await mongo.connect()
+    await ensure_indexes()
+    await backfill_search_keys()
+    await backfill_schedule_slots()
+    await backfill_exam_slots()
+    if await db.attendance_rollups.find_one({}, {"_id": 1}) is None:
+        start_rollup_rebuild()
+    await mongo.warm_indexes(INDEXES, QUERY_SHAPES, MONGO_WARMUP_INDEX_KEYS)
+    await collection_versions.refresh()
+    logger.info("MongoDB ready: ping %.1f ms, %d pooled connections", ping_ms, mongo.pool_stats()["open"])
+    app.state.reconcile_task = asyncio.create_task(reconcile_counters_periodically())
+    app.state.versions_task = asyncio.create_task(refresh_versions_periodically())
+    app.state.slow_query_task = asyncio.create_task(slow_queries.explain_pending())
+    try:
+        yield
+    finally:
+        app.state.reconcile_task.cancel()
+        app.state.versions_task.cancel()
+        app.state.slow_query_task.cancel()
+        if _rollup_rebuild is not None:
+            _rollup_rebuild.cancel()
+        event_broker.close()
+        mongo.close()
+        password_hasher.shutdown()
+        if _import_pool is not None:
+            _import_pool.shutdown(wait=False, cancel_futures=True)
+
+# Create the main app without a prefix
+app = FastAPI(title="University Management System", default_response_class=FastJSONResponse, lifespan=lifespan)
+
+@app.exception_handler(WaitQueueTimeoutError)
+async def pool_exhausted(request: Request, exc: WaitQueueTimeoutError):
+    return FastJSONResponse(
+        {"detail": "Database busy, please retry"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness of the database connection and how full the pool is"""
+    pool = mongo.pool_stats()
+    try:
+        ping_ms = await asyncio.wait_for(mongo.ping(), HEALTH_PING_SECONDS)
+    except Exception as exc:
+        return FastJSONResponse(
+            {"status": "unavailable", "mongo": {"error": str(exc) or type(exc).__name__}, "pool": pool},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    since_timeout = pool["seconds_since_wait_queue_timeout"]
+    degraded = pool["saturation"] >= POOL_SATURATION_WARNING or (
+        since_timeout is not None and since_timeout < POOL_TIMEOUT_WINDOW_SECONDS
+    )
+    return {"status": "degraded" if degraded else "ok", "mongo": {"ping_ms": ping_ms}, "pool": pool}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    if METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get("authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token"
+        )
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+# Outermost, so recorded latency includes compression and CORS handling
+app.add_middleware(MetricsMiddleware, registry=metrics)
 
 # Configure logging
 logging.basicConfig(
@@ -829,7 +4167,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
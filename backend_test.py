@@ -302,6 +302,308 @@ class UniversityAPITester(unittest.TestCase):
         self.assertEqual(response.status_code, 403)
         print("✅ Student cannot access admin endpoints")
 
+    def test_09_pagination(self):
+        """Test keyset pagination on list endpoints"""
+        print("\n--- Testing Pagination ---")
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        response = requests.get(f"{self.base_url}/admin/users", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        all_ids = [user["id"] for user in response.json()]
+        
+        # Walk the users one page at a time
+        paged_ids = []
+        params = {"limit": 1}
+        while True:
+            response = requests.get(f"{self.base_url}/admin/users", headers=headers, params=params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.json()), 1)
+            paged_ids.extend(user["id"] for user in response.json())
+            next_cursor = response.headers.get("X-Next-Cursor")
+            if not next_cursor:
+                break
+            params = {"limit": 1, "cursor": next_cursor}
+        self.assertEqual(paged_ids, all_ids)
+        print("✅ Paging through users returns every user once")
+        
+        # Invalid cursor
+        response = requests.get(f"{self.base_url}/admin/users", headers=headers, params={"cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
+        print("✅ Invalid cursor rejected")
+
+    def test_10_exports(self):
+        """Test streaming exports"""
+        print("\n--- Testing Exports ---")
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        response = requests.get(f"{self.base_url}/admin/export/users", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        self.assertTrue(rows)
+        self.assertNotIn("password", rows[0])
+        print("✅ Users exported as NDJSON")
+        
+        response = requests.get(f"{self.base_url}/admin/export/grades", headers=headers, params={"format": "csv"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.text.startswith("id,student_id,"))
+        print("✅ Grades exported as CSV")
+        
+        # Exports are admin only
+        headers = {"Authorization": f"Bearer {self.teacher_token}"}
+        response = requests.get(f"{self.base_url}/admin/export/grades", headers=headers)
+        self.assertEqual(response.status_code, 403)
+        print("✅ Teacher cannot export")
+
+    def test_11_bulk_grades(self):
+        """Test bulk grade ingestion"""
+        print("\n--- Testing Bulk Grades ---")
+        
+        headers = {"Authorization": f"Bearer {self.teacher_token}"}
+        response = requests.get(f"{self.base_url}/courses/my", headers=headers)
+        courses = response.json()
+        
+        if courses and self.student_user:
+            grade_data = {
+                "student_id": self.student_user["id"],
+                "course_id": courses[0]["id"],
+                "exam_type": "final",
+                "score": 14,
+                "max_score": 20,
+                "exam_date": datetime.now().isoformat()
+            }
+            rows = [grade_data, {**grade_data, "course_id": "missing-course"}]
+            response = requests.post(f"{self.base_url}/grades/bulk", json=rows, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            report = response.json()
+            self.assertEqual(report["inserted"], 1)
+            self.assertEqual(report["errors"], [{"row": 2, "detail": "Course not found"}])
+            print("✅ Bulk grades inserted with a per-row error report")
+        else:
+            print("⚠️ No courses or student available to test bulk grades")
+
+    def test_12_bulk_grades_malformed_csv(self):
+        """Test that CSV rows with extra columns are reported, not fatal"""
+        print("\n--- Testing Malformed Bulk CSV ---")
+        
+        headers = {"Authorization": f"Bearer {self.teacher_token}"}
+        response = requests.get(f"{self.base_url}/courses/my", headers=headers)
+        courses = response.json()
+        
+        if courses and self.student_user:
+            row = f"{self.student_user['id']},{courses[0]['id']},final,12,20,{datetime.now().isoformat()}"
+            body = "student_id,course_id,exam_type,score,max_score,exam_date\n" + f"{row},\n{row}\n"
+            response = requests.post(
+                f"{self.base_url}/grades/bulk", data=body.encode(),
+                headers={**headers, "Content-Type": "text/csv"}
+            )
+            self.assertEqual(response.status_code, 200)
+            report = response.json()
+            self.assertEqual(report["inserted"], 1)
+            self.assertEqual(report["errors"], [{"row": 1, "detail": "Unexpected extra columns"}])
+            print("✅ CSV row with extra columns reported as a row error")
+        else:
+            print("⚠️ No courses or student available to test malformed CSV")
+
+    def test_13_schedule_conflicts(self):
+        """Test that overlapping schedules and bad times are rejected"""
+        print("\n--- Testing Schedule Conflicts ---")
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}"}
+        response = requests.get(f"{self.base_url}/courses", headers=headers)
+        courses = response.json()
+        
+        if courses:
+            # A classroom of its own, so earlier runs cannot interfere
+            classroom = f"Conflict Room {datetime.now().timestamp()}"
+            schedule_data = {
+                "course_id": courses[0]["id"],
+                "day_of_week": "Saturday",
+                "start_time": "08:00",
+                "end_time": "10:00",
+                "classroom": classroom
+            }
+            response = requests.post(f"{self.base_url}/schedules", json=schedule_data, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            schedule_id = response.json()["id"]
+            
+            overlapping = {**schedule_data, "start_time": "09:00", "end_time": "11:00"}
+            response = requests.post(f"{self.base_url}/schedules", json=overlapping, headers=headers)
+            self.assertEqual(response.status_code, 409)
+            conflicts = response.json()["detail"]["conflicts"]
+            self.assertIn(schedule_id, [conflict["id"] for conflict in conflicts])
+            print("✅ Overlapping schedule rejected with its conflicts")
+            
+            # Back to back is not an overlap
+            response = requests.put(
+                f"{self.base_url}/schedules/{schedule_id}",
+                json={**schedule_data, "start_time": "10:00", "end_time": "12:00"}, headers=headers
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("start_minute", response.json())
+            self.assertNotIn("teacher_id", response.json())
+            print("✅ Schedule moved without exposing internal fields")
+            
+            for start_time, end_time in [("25:00", "26:00"), ("11:00", "10:00")]:
+                bad_times = {**schedule_data, "start_time": start_time, "end_time": end_time}
+                response = requests.post(f"{self.base_url}/schedules", json=bad_times, headers=headers)
+                self.assertEqual(response.status_code, 400)
+            print("✅ Invalid schedule times rejected")
+            
+            response = requests.get(f"{self.base_url}/schedules/conflicts", headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("conflict_count", response.json())
+            print("✅ Conflict report available")
+            
+            requests.delete(f"{self.base_url}/schedules/{schedule_id}", headers=headers)
+        else:
+            print("⚠️ No courses available to test schedule conflicts")
+
+    def test_14_approve_pending_proposals(self):
+        """Test batch approval of pending exam proposals"""
+        print("\n--- Testing Batch Exam Approval ---")
+        
+        headers = {"Authorization": f"Bearer {self.teacher_token}"}
+        response = requests.get(f"{self.base_url}/courses/my", headers=headers)
+        teacher_courses = response.json()
+        
+        if teacher_courses:
+            # A date of its own, so earlier runs cannot clash with it
+            proposed_date = datetime(2030, 1, 1) + timedelta(minutes=int(datetime.now().timestamp()) % 500000 * 10)
+            proposal_data = {
+                "course_id": teacher_courses[0]["id"],
+                "exam_type": "final",
+                "title": "Batch Approval Exam",
+                "description": "Approved in a batch",
+                "proposed_date": proposed_date.isoformat(),
+                "duration_minutes": 90
+            }
+            response = requests.post(f"{self.base_url}/exam-proposals", json=proposal_data, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            proposal_id = response.json()["id"]
+            
+            admin_headers = {"Authorization": f"Bearer {self.admin_token}"}
+            response = requests.post(f"{self.base_url}/exam-proposals/approve-pending", headers=admin_headers)
+            self.assertEqual(response.status_code, 200)
+            report = response.json()
+            self.assertIn(proposal_id, report["approved_ids"])
+            self.assertEqual(report["approved"], len(report["approved_ids"]))
+            print("✅ Pending proposal approved in a batch")
+            
+            # The same teacher cannot propose an overlapping exam
+            overlapping = {**proposal_data, "proposed_date": (proposed_date + timedelta(minutes=30)).isoformat()}
+            response = requests.post(f"{self.base_url}/exam-proposals", json=overlapping, headers=headers)
+            self.assertEqual(response.status_code, 409)
+            self.assertIn(proposal_id, [clash["id"] for clash in response.json()["detail"]["clashes"]])
+            print("✅ Overlapping exam proposal rejected")
+            
+            response = requests.post(f"{self.base_url}/exam-proposals/approve-pending", headers=headers)
+            self.assertEqual(response.status_code, 403)
+            print("✅ Teacher cannot batch approve")
+        else:
+            print("⚠️ No courses available to test batch approval")
+
+    def test_15_transcripts(self):
+        """Test stored transcripts"""
+        print("\n--- Testing Transcripts ---")
+        
+        headers = {"Authorization": f"Bearer {self.teacher_token}"}
+        response = requests.get(f"{self.base_url}/courses/my", headers=headers)
+        courses = response.json()
+        
+        if courses and self.student_user:
+            course_id = courses[0]["id"]
+            grade_data = {
+                "student_id": self.student_user["id"],
+                "course_id": course_id,
+                "exam_type": "final",
+                "score": 16,
+                "max_score": 20,
+                "exam_date": datetime.now().isoformat()
+            }
+            response = requests.post(f"{self.base_url}/grades", json=grade_data, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            
+            headers = {"Authorization": f"Bearer {self.student_token}"}
+            response = requests.get(f"{self.base_url}/transcripts/me", headers=headers)
+            self.assertEqual(response.status_code, 200)
+            transcript = response.json()
+            self.assertIn(course_id, [row["course_id"] for row in transcript["courses"]])
+            self.assertIsNotNone(transcript["cumulative"]["gpa"])
+            self.assertNotIn("version", transcript)
+            print("✅ Student transcript includes the new grade")
+            
+            headers = {"Authorization": f"Bearer {self.admin_token}"}
+            response = requests.get(f"{self.base_url}/transcripts/{self.student_user['id']}", headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["cumulative"], transcript["cumulative"])
+            print("✅ Admin can read a student's transcript")
+        else:
+            print("⚠️ No courses or student available to test transcripts")
+
+    def test_16_grade_stats(self):
+        """Test cached grade statistics"""
+        print("\n--- Testing Grade Stats ---")
+        
+        headers = {"Authorization": f"Bearer {self.teacher_token}"}
+        response = requests.get(f"{self.base_url}/courses/my", headers=headers)
+        courses = response.json()
+        
+        if courses and self.student_user:
+            course_id = courses[0]["id"]
+            response = requests.get(f"{self.base_url}/courses/{course_id}/grade-stats", headers=headers)
+            self.assertEqual(response.status_code, 200)
+            before = response.json()
+            self.assertEqual(len(before["histogram"]), 10)
+            
+            grade_data = {
+                "student_id": self.student_user["id"],
+                "course_id": course_id,
+                "exam_type": "final",
+                "score": 16,
+                "max_score": 20,
+                "exam_date": datetime.now().isoformat()
+            }
+            response = requests.post(f"{self.base_url}/grades", json=grade_data, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            
+            response = requests.get(f"{self.base_url}/courses/{course_id}/grade-stats", headers=headers)
+            self.assertEqual(response.status_code, 200)
+            after = response.json()
+            self.assertEqual(after["count"], before["count"] + 1)
+            self.assertEqual(sum(bucket["count"] for bucket in after["histogram"]), after["count"])
+            print("✅ Grade stats recomputed after a grade write")
+            
+            headers = {"Authorization": f"Bearer {self.student_token}"}
+            response = requests.get(f"{self.base_url}/courses/{course_id}/grade-stats", headers=headers)
+            self.assertEqual(response.status_code, 403)
+            print("✅ Student cannot read grade stats")
+        else:
+            print("⚠️ No courses or student available to test grade stats")
+
+    def test_17_etags(self):
+        """Test conditional requests on list endpoints, compressed or not"""
+        print("\n--- Testing ETags ---")
+        
+        headers = {"Authorization": f"Bearer {self.admin_token}", "Accept-Encoding": "identity"}
+        response = requests.get(f"{self.base_url}/courses", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        
+        response = requests.get(f"{self.base_url}/courses", headers={**headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        print("✅ Unchanged list answered with 304")
+        
+        # A tag received on a compressed response still matches
+        response = requests.get(f"{self.base_url}/courses", headers={**headers, "If-None-Match": f'{etag[:-1]}-gzip"'})
+        self.assertEqual(response.status_code, 304)
+        response = requests.get(f"{self.base_url}/courses", headers={**headers, "If-None-Match": f"W/{etag}"})
+        self.assertEqual(response.status_code, 304)
+        print("✅ Compressed and weak tags round trip")
+        
+        response = requests.get(f"{self.base_url}/courses", headers={**headers, "If-None-Match": '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        print("✅ Stale tag gets the full list")
+
 if __name__ == "__main__":
     tester = UniversityAPITester()
     tester.setUp()
@@ -315,5 +617,14 @@ if __name__ == "__main__":
     tester.test_06_grades()
     tester.test_07_attendance()
     tester.test_08_admin_endpoints()
+    tester.test_09_pagination()
+    tester.test_10_exports()
+    tester.test_11_bulk_grades()
+    tester.test_12_bulk_grades_malformed_csv()
+    tester.test_13_schedule_conflicts()
+    tester.test_14_approve_pending_proposals()
+    tester.test_15_transcripts()
+    tester.test_16_grade_stats()
+    tester.test_17_etags()
     
     print("\n✅ All API tests completed")
\ No newline at end of file
@@ -0,0 +1,249 @@
+"""Deterministic dataset generator for the benchmark suite.
+
+The same seed and sizes always produce the same documents, ids included,
+stored in the shape the API itself writes them (search keys, schedule
+slots, exam clash keys), so runs against different builds are comparable.
+Large collections are generated in batches and never held in memory.
+
+Every seeded account uses the password ``PASSWORD``; the admin is
+``ADMIN_EMAIL`` and the others are ``teacher<n>@bench.local`` and
+``student<n>@bench.local``.
+
+Importing this module imports the backend, so set ``MONGO_URL``/``DB_NAME``
+(and patch the Mongo client for in-memory runs) beforehand.
+"""
+import hashlib
+import math
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+SCALES = {
+    "tiny": {"students": 200, "teachers": 20, "courses": 50, "grades": 5_000, "attendance": 10_000},
+    "small": {"students": 2_000, "teachers": 100, "courses": 300, "grades": 50_000, "attendance": 100_000},
+    "semester": {
+        "students": 20_000, "teachers": 500, "courses": 2_000,
+        "grades": 1_000_000, "attendance": 2_000_000,
+    },
+}
+
+PASSWORD = "bench123"
+ADMIN_EMAIL = "admin@bench.local"
+YEAR = 2025
+SEMESTER = "S1"
+SEMESTER_START = datetime(2025, 9, 1)
+SEMESTER_WEEKS = 14
+EXAM_PERIOD_START = datetime(2026, 1, 5, 8)
+
+DEPARTMENTS = ["Computer Science", "Mathematics", "Physics", "Chemistry", "Biology", "Economics", "Law", "History"]
+LEVELS = ["L1", "L2", "L3", "M1", "M2"]
+FIRST_NAMES = [
+    "Amine", "Sarah", "Yacine", "Lina", "Karim", "Nadia", "Omar", "Ines", "Walid", "Meriem",
+    "Samir", "Leila", "Hakim", "Amel", "Riad", "Sofia", "Nassim", "Yasmine", "Farid", "Rania",
+]
+LAST_NAMES = [
+    "Benali", "Haddad", "Mansouri", "Boudiaf", "Cherif", "Kaci", "Zerrouki", "Belkacem",
+    "Saidi", "Hamidi", "Ait Ali", "Meziane", "Toumi", "Rahmani", "Bouzid", "Larbi",
+]
+SUBJECTS = [
+    "Algorithms", "Databases", "Linear Algebra", "Analysis", "Mechanics", "Thermodynamics",
+    "Organic Chemistry", "Genetics", "Microeconomics", "Constitutional Law", "Modern History",
+    "Operating Systems", "Networks", "Statistics", "Optics", "Ecology",
+]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Sunday"]
+SLOTS = [("08:00", "09:30"), ("09:40", "11:10"), ("11:20", "12:50"), ("13:00", "14:30"), ("14:40", "16:10")]
+BATCH_SIZE = 10_000
+
+
+def stable_id(seed, kind, index):
+    """A uuid4-formatted id that depends only on the seed, kind and index"""
+    digest = hashlib.md5(f"{seed}:{kind}:{index}".encode()).digest()
+    return str(uuid.UUID(bytes=digest, version=4))
+
+
+class Dataset:
+    def __init__(self, seed=42, students=200, teachers=20, courses=50, grades=5_000, attendance=10_000):
+        self.seed = seed
+        self.sizes = {
+            "students": students, "teachers": teachers, "courses": courses,
+            "grades": grades, "attendance": attendance,
+        }
+        self.admin_id = stable_id(seed, "admin", 0)
+        self.teacher_ids = [stable_id(seed, "teacher", i) for i in range(teachers)]
+        self.student_ids = [stable_id(seed, "student", i) for i in range(students)]
+        self.course_ids = [stable_id(seed, "course", i) for i in range(courses)]
+        rooms_needed = math.ceil(courses / (len(DAYS) * len(SLOTS)) * 1.25)
+        self.classrooms = [f"{block}{number:02d}" for block in "ABCDEFGH" for number in range(1, 21)][:max(rooms_needed, 1)]
+        self._password_hash = None
+
+    @classmethod
+    def from_scale(cls, scale, seed=42, **overrides):
+        sizes = dict(SCALES[scale])
+        sizes.update({name: value for name, value in overrides.items() if value is not None})
+        return cls(seed=seed, **sizes)
+
+    def _rng(self, stream):
+        # One random stream per collection, so resizing one leaves the others unchanged
+        return random.Random(f"{self.seed}:{stream}")
+
+    @property
+    def password_hash(self):
+        if self._password_hash is None:
+            self._password_hash = server.bcrypt_hash(PASSWORD, server.BCRYPT_ROUNDS)
+        return self._password_hash
+
+    def _user(self, rng, user_id, email, role, index, **fields):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        user = server.User(
+            id=user_id, email=email, password=self.password_hash, first_name=first,
+            last_name=f"{last} {index}", role=role, phone=f"+213 555 {index:06d}",
+            created_at=SEMESTER_START - timedelta(days=30, minutes=index), **fields,
+        ).dict()
+        user["role"] = server.UserRole(role).value
+        user.update(server.build_search_index(user, "users"))
+        return user
+
+    def users(self):
+        rng = self._rng("users")
+        yield self._user(rng, self.admin_id, ADMIN_EMAIL, "admin", 0)
+        for i, teacher_id in enumerate(self.teacher_ids):
+            yield self._user(
+                rng, teacher_id, f"teacher{i}@bench.local", "teacher", i,
+                department=DEPARTMENTS[i % len(DEPARTMENTS)], specialty=rng.choice(SUBJECTS),
+            )
+        for i, student_id in enumerate(self.student_ids):
+            yield self._user(
+                rng, student_id, f"student{i}@bench.local", "student", i,
+                student_id=f"{YEAR}{i:06d}", department=DEPARTMENTS[i % len(DEPARTMENTS)],
+                year=YEAR, level=LEVELS[i % len(LEVELS)], field_of_study=DEPARTMENTS[i % len(DEPARTMENTS)],
+            )
+
+    def course_teacher(self, index):
+        return self.teacher_ids[index % len(self.teacher_ids)]
+
+    def course_department(self, index):
+        return DEPARTMENTS[(index % len(self.teacher_ids)) % len(DEPARTMENTS)]
+
+    def courses(self):
+        rng = self._rng("courses")
+        for i, course_id in enumerate(self.course_ids):
+            subject = rng.choice(SUBJECTS)
+            course = server.Course(
+                id=course_id, name=f"{subject} {i // len(SUBJECTS) + 1}", code=f"C{i:04d}",
+                description=f"{subject}: lectures, tutorials and a final exam.",
+                teacher_id=self.course_teacher(i), department=self.course_department(i),
+                credits=rng.choice([2, 3, 4, 5, 6]), semester=SEMESTER, year=YEAR,
+                created_at=SEMESTER_START - timedelta(days=20),
+            ).dict()
+            course.update(server.build_search_index(course, "courses"))
+            yield course
+
+    def schedules(self):
+        """One conflict-free weekly session per course, placed by the timetable solver"""
+        slots = [
+            {"start_time": start, "end_time": end, **server.schedule_slot(start, end)}
+            for start, end in SLOTS
+        ]
+        courses = [
+            {"id": course_id, "code": f"C{i:04d}", "teacher_id": self.course_teacher(i)}
+            for i, course_id in enumerate(self.course_ids)
+        ]
+        solver = server.TimetableSolver(courses, self.classrooms, DAYS, slots, 1, self.seed)
+        solver.solve(10.0)
+        for i, entry in enumerate(solver.schedules()):
+            yield {
+                **server.Schedule(id=stable_id(self.seed, "schedule", i), created_at=SEMESTER_START, **entry).dict(),
+                **entry,
+            }
+
+    def grades(self):
+        rng = self._rng("grades")
+        exam_types = [server.ExamType.CONTINUOUS.value, server.ExamType.FINAL.value]
+        for i in range(self.sizes["grades"]):
+            course = rng.randrange(len(self.course_ids))
+            score = min(20.0, max(0.0, round(rng.gauss(11.5, 3.5), 2)))
+            yield {
+                "id": stable_id(self.seed, "grade", i),
+                "student_id": self.student_ids[rng.randrange(len(self.student_ids))],
+                "course_id": self.course_ids[course],
+                "exam_type": exam_types[i % 2],
+                "score": score,
+                "max_score": 20.0,
+                "exam_date": SEMESTER_START + timedelta(days=rng.randrange(SEMESTER_WEEKS * 7)),
+                "created_at": SEMESTER_START + timedelta(seconds=i),
+            }
+
+    def attendance(self):
+        rng = self._rng("attendance")
+        for i in range(self.sizes["attendance"]):
+            course = rng.randrange(len(self.course_ids))
+            day = SEMESTER_START + timedelta(days=rng.randrange(SEMESTER_WEEKS * 7), hours=8)
+            yield {
+                "id": stable_id(self.seed, "attendance", i),
+                "teacher_id": self.course_teacher(course),
+                "course_id": self.course_ids[course],
+                "date": day,
+                "status": "present" if rng.random() < 0.85 else "absent",
+                "notes": None,
+                "created_at": day,
+            }
+
+    def exam_proposals(self):
+        """One final exam per course, a third of them already approved"""
+        rng = self._rng("exam_proposals")
+        for i, course_id in enumerate(self.course_ids):
+            proposal = server.ExamProposal(
+                id=stable_id(self.seed, "exam_proposal", i), teacher_id=self.course_teacher(i),
+                course_id=course_id, exam_type=server.ExamType.FINAL, title=f"Final exam C{i:04d}",
+                description="Written exam", proposed_date=EXAM_PERIOD_START + timedelta(hours=3 * i),
+                duration_minutes=rng.choice([60, 90, 120]), classroom=rng.choice(self.classrooms),
+                level=LEVELS[i % len(LEVELS)], status="approved" if i % 3 == 0 else "pending",
+                created_at=SEMESTER_START + timedelta(days=60, minutes=i),
+            ).dict()
+            proposal["exam_type"] = proposal["exam_type"].value
+            proposal.update(server.exam_slot(proposal, {"department": self.course_department(i)}))
+            yield proposal
+
+    def collections(self):
+        return {
+            "users": self.users,
+            "courses": self.courses,
+            "schedules": self.schedules,
+            "grades": self.grades,
+            "attendance": self.attendance,
+            "exam_proposals": self.exam_proposals,
+        }
+
+
+def batches(documents, size=BATCH_SIZE):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def seed(db, dataset, log=print):
+    """Insert the dataset, then build the derived collections the API maintains"""
+    for name, documents in dataset.collections().items():
+        count = 0
+        for batch in batches(documents()):
+            await db[name].insert_many(batch, ordered=False)
+            if name == "attendance":
+                await server.record_attendance(batch)
+            count += len(batch)
+        log(f"{name:<16} {count:>10,} documents")
+
+    await server.ensure_indexes()
+    await server.reconcile_counters()
+    await server.refresh_transcripts(dataset.student_ids)
+    log("derived        counters, attendance rollups and transcripts rebuilt")
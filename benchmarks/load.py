@@ -0,0 +1,438 @@
+"""Per-endpoint load benchmark.
+
+Drives every /api route with concurrent async clients against a database
+seeded by ``seed.py`` and reports, per endpoint, the request count, errors,
+p50/p95/p99 latency and throughput. Endpoints run one after another so each
+line measures that route alone. Writes use fresh data per request (unique
+emails, course codes, classrooms and exam dates) so they measure the write
+path rather than 409s, and deletes and updates act on records created in an
+untimed setup step. The server-sent events stream is timed to its first
+frame. Routes the API exposes but no scenario covers are listed at the end.
+
+Against a running server (seeded with the same --seed and --scale):
+    python benchmarks/seed.py --db bench --scale semester --drop
+    DB_NAME=bench uvicorn server:app --app-dir backend --port 8001
+    python benchmarks/load.py --base-url http://localhost:8001/api --scale semester
+
+Self-contained, with the backend served in-process on mongomock-motor and a
+small dataset (numbers are only comparable between in-memory runs; routes
+that need a real mongod, such as the explain-based index report, are skipped):
+    python benchmarks/load.py --in-memory --scale tiny --requests 50
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Scenario:
+    """One route: how to build a request, who sends it and how often"""
+
+    def __init__(self, method, route, build, role="admin", max_requests=None, stream=False, needs_mongod=False):
+        self.method = method
+        self.route = route
+        self.build = build
+        self.role = role
+        self.max_requests = max_requests
+        self.stream = stream
+        self.needs_mongod = needs_mongod
+
+    @property
+    def name(self):
+        return f"{self.method} {self.route}"
+
+
+class Bench:
+    """Shared state for the scenarios: the dataset, tokens and unique counters"""
+
+    def __init__(self, client, data, dataset_module):
+        self.client = client
+        self.data = data
+        self.ds = dataset_module
+        self.run = uuid.uuid4().hex[:8]
+        self.counter = itertools.count()
+        self.tokens = {}
+
+    def unique(self):
+        return next(self.counter)
+
+    def headers(self, role):
+        return {"Authorization": f"Bearer {self.tokens[role]}"} if role else {}
+
+    async def login(self, role, email):
+        response = await self.client.post("/auth/login", json={"email": email, "password": self.ds.PASSWORD})
+        response.raise_for_status()
+        self.tokens[role] = response.json()["access_token"]
+
+    async def setup(self, method, url, role="admin", **kwargs):
+        """An untimed request that prepares data for the timed one"""
+        response = await self.client.request(method, url, headers=self.headers(role), **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def pick(self, ids, i):
+        return ids[i % len(ids)]
+
+    # Request bodies
+
+    def user_body(self, i, prefix="user"):
+        return {
+            "email": f"{prefix}-{self.run}-{i}@bench.local", "password": self.ds.PASSWORD,
+            "first_name": "Bench", "last_name": f"User {i}", "role": "student",
+            "student_id": f"B{self.run}{i}", "department": "Computer Science", "year": 2, "level": "L2",
+        }
+
+    def course_body(self, i, teacher_id=None):
+        return {
+            "name": f"Bench course {i}", "code": f"B{self.run}-{i}", "description": "Benchmark course",
+            "teacher_id": teacher_id or self.pick(self.data.teacher_ids, i), "department": "Computer Science",
+            "credits": 4, "semester": "S2", "year": self.ds.YEAR,
+        }
+
+    def grade_body(self, i):
+        return {
+            "student_id": self.pick(self.data.student_ids, i), "course_id": self.pick(self.data.course_ids, i),
+            "exam_type": "continuous", "score": float(i % 21), "max_score": 20.0,
+            "exam_date": self.ds.SEMESTER_START.isoformat(),
+        }
+
+    def schedule_body(self, course_id, i):
+        return {
+            "course_id": course_id, "day_of_week": "Saturday", "start_time": "08:00", "end_time": "09:30",
+            "classroom": f"BENCH-{self.run}-{i}",
+        }
+
+    def proposal_body(self, i):
+        # Ten hours apart and long after the seeded exam period, so they never clash
+        date = self.ds.EXAM_PERIOD_START + timedelta(days=365, hours=10 * i)
+        return {
+            "course_id": self.pick(self.data.course_ids, i), "exam_type": "final", "title": f"Bench exam {i}",
+            "description": "Benchmark proposal", "proposed_date": date.isoformat(), "duration_minutes": 90,
+            "classroom": f"BENCH-{self.run}", "level": "L2",
+        }
+
+    async def scratch_course(self, i):
+        # A teacher id of its own keeps schedules for it free of teacher clashes
+        course = self.course_body(i, teacher_id=f"bench-teacher-{self.run}-{i}")
+        return (await self.setup("POST", "/courses", json=course))["id"]
+
+    # Scenarios
+
+    def scenarios(self):
+        data = self.data
+        year = self.ds.YEAR
+
+        async def get(url, **params):
+            return {"url": url, "params": params}
+
+        async def create_course(b, i):
+            return {"url": "/courses", "json": b.course_body(b.unique())}
+
+        async def update_course(b, i):
+            n = b.unique()
+            course_id = (await b.setup("POST", "/courses", json=b.course_body(n)))["id"]
+            return {"url": f"/courses/{course_id}", "json": {**b.course_body(n), "credits": 5}}
+
+        async def delete_course(b, i):
+            return {"url": f"/courses/{(await b.setup('POST', '/courses', json=b.course_body(b.unique())))['id']}"}
+
+        async def create_schedule(b, i):
+            n = b.unique()
+            return {"url": "/schedules", "json": b.schedule_body(await b.scratch_course(n), n)}
+
+        async def update_schedule(b, i):
+            n = b.unique()
+            body = b.schedule_body(await b.scratch_course(n), n)
+            schedule_id = (await b.setup("POST", "/schedules", json=body))["id"]
+            return {"url": f"/schedules/{schedule_id}", "json": {**body, "start_time": "10:00", "end_time": "11:30"}}
+
+        async def delete_schedule(b, i):
+            n = b.unique()
+            body = b.schedule_body(await b.scratch_course(n), n)
+            return {"url": f"/schedules/{(await b.setup('POST', '/schedules', json=body))['id']}"}
+
+        async def generate_timetable(b, i):
+            return {"url": "/schedules/generate", "json": {
+                "year": year, "semester": self.ds.SEMESTER, "classrooms": data.classrooms, "days": self.ds.DAYS,
+                "slots": [{"start_time": start, "end_time": end} for start, end in self.ds.SLOTS],
+                "time_budget_seconds": 5, "seed": i, "dry_run": True,
+            }}
+
+        async def update_grade(b, i):
+            return {"url": f"/grades/{self.ds.stable_id(data.seed, 'grade', i % data.sizes['grades'])}",
+                    "json": {**b.grade_body(i), "score": float(i % 21)}}
+
+        async def delete_grade(b, i):
+            return {"url": f"/grades/{(await b.setup('POST', '/grades', json=b.grade_body(b.unique())))['id']}"}
+
+        async def update_proposal_status(b, i):
+            proposal = await b.setup("POST", "/exam-proposals", role="teacher", json=b.proposal_body(b.unique()))
+            return {"url": f"/exam-proposals/{proposal['id']}/status", "params": {"status": "rejected"}}
+
+        async def attendance(b, i):
+            date = self.ds.SEMESTER_START + timedelta(days=i % (self.ds.SEMESTER_WEEKS * 7), hours=8)
+            return {"url": "/attendance", "json": {
+                "course_id": self.ds.stable_id(data.seed, "course", 0), "date": date.isoformat(), "status": "present",
+            }}
+
+        async def import_job(b, i):
+            rows = [b.user_body(b.unique(), "import") for _ in range(5)]
+            job = await b.setup("POST", "/admin/users/import", json=rows)
+            return {"url": f"/admin/users/import/{job['id']}"}
+
+        async def update_user(b, i):
+            user = await b.setup("POST", "/admin/users", json=b.user_body(b.unique(), "admin-user"))
+            return {"url": f"/admin/users/{user['id']}", "json": {"phone": "+213 555 000000", "level": "L3"}}
+
+        async def delete_user(b, i):
+            user = await b.setup("POST", "/admin/users", json=b.user_body(b.unique(), "admin-user"))
+            return {"url": f"/admin/users/{user['id']}"}
+
+        def course(i):
+            return self.ds.stable_id(data.seed, "course", i % data.sizes["courses"])
+
+        return [
+            Scenario("GET", "/", lambda b, i: get("/"), role=None),
+            Scenario("POST", "/auth/register", lambda b, i: _json("/auth/register", b.user_body(b.unique(), "register")), role=None),
+            Scenario("POST", "/auth/login", lambda b, i: _json("/auth/login", {
+                "email": f"student{i % data.sizes['students']}@bench.local", "password": self.ds.PASSWORD,
+            }), role=None),
+            Scenario("GET", "/auth/me", lambda b, i: get("/auth/me"), role="student"),
+            Scenario("POST", "/courses", create_course),
+            Scenario("GET", "/courses", lambda b, i: get("/courses", limit=50)),
+            Scenario("PUT", "/courses/{course_id}", update_course),
+            Scenario("DELETE", "/courses/{course_id}", delete_course),
+            Scenario("GET", "/courses/my", lambda b, i: get("/courses/my"), role="teacher"),
+            Scenario("GET", "/courses/{course_id}/grade-stats", lambda b, i: get(f"/courses/{course(i)}/grade-stats")),
+            Scenario("POST", "/schedules", create_schedule),
+            Scenario("POST", "/schedules/generate", generate_timetable, max_requests=5),
+            Scenario("GET", "/schedules/conflicts", lambda b, i: get("/schedules/conflicts"), max_requests=20),
+            Scenario("GET", "/schedules", lambda b, i: get("/schedules", limit=50)),
+            Scenario("PUT", "/schedules/{schedule_id}", update_schedule),
+            Scenario("DELETE", "/schedules/{schedule_id}", delete_schedule),
+            Scenario("POST", "/grades", lambda b, i: _json("/grades", b.grade_body(i))),
+            Scenario("POST", "/grades/bulk", lambda b, i: _json("/grades/bulk", [b.grade_body(i * 50 + n) for n in range(50)])),
+            Scenario("GET", "/grades", lambda b, i: get("/grades", limit=50)),
+            Scenario("PUT", "/grades/{grade_id}", update_grade),
+            Scenario("DELETE", "/grades/{grade_id}", delete_grade),
+            Scenario("GET", "/grades/my", lambda b, i: get("/grades/my"), role="student"),
+            Scenario("GET", "/transcripts/me", lambda b, i: get("/transcripts/me"), role="student"),
+            Scenario("GET", "/transcripts/{student_id}", lambda b, i: get(f"/transcripts/{b.pick(data.student_ids, i)}")),
+            Scenario("POST", "/exam-proposals", lambda b, i: _json("/exam-proposals", b.proposal_body(b.unique())), role="teacher"),
+            Scenario("GET", "/exam-proposals", lambda b, i: get("/exam-proposals", limit=50)),
+            Scenario("POST", "/exam-proposals/approve-pending", lambda b, i: _json("/exam-proposals/approve-pending", None), max_requests=10),
+            Scenario("PUT", "/exam-proposals/{proposal_id}/status", update_proposal_status),
+            Scenario("POST", "/attendance", attendance, role="teacher"),
+            Scenario("GET", "/attendance", lambda b, i: get("/attendance", limit=50)),
+            Scenario("GET", "/attendance/analytics/courses/{course_id}", lambda b, i: get(f"/attendance/analytics/courses/{course(i)}", granularity="week")),
+            Scenario("GET", "/attendance/analytics/summary", lambda b, i: get("/attendance/analytics/summary")),
+            Scenario("POST", "/events/token", lambda b, i: _json("/events/token", None), role="student"),
+            Scenario("GET", "/events", lambda b, i: get("/events"), role="student", stream=True),
+            Scenario("GET", "/admin/events", lambda b, i: get("/admin/events")),
+            Scenario("GET", "/admin/users", lambda b, i: get("/admin/users", limit=50)),
+            Scenario("POST", "/admin/users", lambda b, i: _json("/admin/users", b.user_body(b.unique(), "admin-user"))),
+            Scenario("POST", "/admin/users/import", lambda b, i: _json("/admin/users/import", [b.user_body(b.unique(), "import") for _ in range(20)]), max_requests=20),
+            Scenario("GET", "/admin/users/import/{job_id}", import_job, max_requests=20),
+            Scenario("PUT", "/admin/users/{user_id}", update_user),
+            Scenario("DELETE", "/admin/users/{user_id}", delete_user),
+            Scenario("GET", "/admin/export/{collection_name}", lambda b, i: get("/admin/export/grades"), max_requests=5),
+            Scenario("GET", "/admin/cache", lambda b, i: get("/admin/cache")),
+            Scenario("GET", "/admin/indexes", lambda b, i: get("/admin/indexes"), max_requests=20, needs_mongod=True),
+            Scenario("GET", "/admin/slow-queries", lambda b, i: get("/admin/slow-queries")),
+            Scenario("DELETE", "/admin/slow-queries", lambda b, i: get("/admin/slow-queries"), max_requests=5),
+            Scenario("GET", "/stats", lambda b, i: get("/stats")),
+            Scenario("POST", "/admin/stats/reconcile", lambda b, i: _json("/admin/stats/reconcile", None), max_requests=5),
+            Scenario("POST", "/admin/attendance/rollups/rebuild", lambda b, i: _json("/admin/attendance/rollups/rebuild", None), max_requests=2, needs_mongod=True),
+        ]
+
+
+async def _json(url, body):
+    return {"url": url} if body is None else {"url": url, "json": body}
+
+
+async def timed_request(bench, scenario, i, semaphore, result):
+    async with semaphore:
+        try:
+            request = await scenario.build(bench, i)
+        except httpx.HTTPError as exc:
+            result["setup_errors"] += 1
+            result["last_error"] = f"setup: {exc}"
+            return
+        headers = bench.headers(scenario.role)
+        started = time.perf_counter()
+        try:
+            if scenario.stream:
+                # Time to the first frame (the reconnect delay line), then hang up
+                async with bench.client.stream(scenario.method, headers=headers, **request) as response:
+                    async for _ in response.aiter_bytes():
+                        break
+            else:
+                response = await bench.client.request(scenario.method, headers=headers, **request)
+        except httpx.HTTPError as exc:
+            result["errors"] += 1
+            result["last_error"] = repr(exc)
+            return
+        result["samples"].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            result["errors"] += 1
+            result["last_error"] = f"{response.status_code} {response.text[:200] if not scenario.stream else ''}"
+
+
+async def run_scenario(bench, scenario, requests, concurrency):
+    count = min(requests, scenario.max_requests or requests)
+    result = {"name": scenario.name, "samples": [], "errors": 0, "setup_errors": 0, "last_error": None}
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(timed_request(bench, scenario, i, semaphore, result) for i in range(count)))
+    result["elapsed"] = time.perf_counter() - started
+    return result
+
+
+def report_line(result):
+    samples = result["samples"]
+    rps = len(samples) / result["elapsed"] if result["elapsed"] else 0.0
+    return (
+        f"{result['name']:<52} n={len(samples):<5} err={result['errors'] + result['setup_errors']:<4} "
+        f"p50={percentile(samples, 50) * 1000:8.1f}ms "
+        f"p95={percentile(samples, 95) * 1000:8.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.1f}ms "
+        f"rps={rps:8.1f}"
+    )
+
+
+async def uncovered_routes(client, scenarios):
+    """Routes in the OpenAPI schema that no scenario exercises"""
+    response = await client.get("/openapi.json")
+    if response.status_code != 200:
+        return []
+    covered = {(s.method, s.route) for s in scenarios}
+    routes = []
+    for path, methods in response.json().get("paths", {}).items():
+        if not path.startswith("/api"):
+            continue
+        route = path[len("/api"):] or "/"
+        routes.extend(
+            f"{method.upper()} {route}" for method in methods
+            if (method.upper(), route) not in covered
+        )
+    return routes
+
+
+async def start_in_memory(args):
+    """Seed an in-memory database and serve the backend from this event loop"""
+    import mongomock_motor
+    import motor.motor_asyncio
+    import uvicorn
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "bench")
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    import dataset
+    import server
+
+    data = dataset.Dataset.from_scale(args.scale, seed=args.seed)
+    print(f"Seeding in-memory database: {data.sizes}")
+    await dataset.seed(server.db, data)
+    config = uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning", lifespan="on")
+    uvicorn_server = uvicorn.Server(config)
+    task = asyncio.create_task(uvicorn_server.serve())
+    while not uvicorn_server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return dataset, data, uvicorn_server, task, f"http://127.0.0.1:{args.port}/api"
+
+
+async def main(args):
+    # The backend configures INFO logging, which would log every client request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    uvicorn_server = task = None
+    if args.in_memory:
+        dataset, data, uvicorn_server, task, base_url = await start_in_memory(args)
+    else:
+        # Only the id scheme and the constants are needed; the backend import reads these
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+        os.environ.setdefault("DB_NAME", "bench")
+        import dataset
+        data = dataset.Dataset.from_scale(args.scale, seed=args.seed)
+        base_url = args.base_url
+
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    results = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            bench = Bench(client, data, dataset)
+            await bench.login("admin", dataset.ADMIN_EMAIL)
+            await bench.login("teacher", "teacher0@bench.local")
+            await bench.login("student", "student0@bench.local")
+            all_scenarios = bench.scenarios()
+            scenarios = [
+                s for s in all_scenarios
+                if (not args.only or re.search(args.only, s.name)) and not (args.in_memory and s.needs_mongod)
+            ]
+            print(f"{len(scenarios)} endpoints, {args.requests} requests each at concurrency {args.concurrency}")
+            for scenario in scenarios:
+                result = await run_scenario(bench, scenario, args.requests, args.concurrency)
+                results.append(result)
+                print(report_line(result), flush=True)
+                if result["last_error"] and args.verbose:
+                    print(f"    last error: {result['last_error']}")
+        if not args.only:
+            async with httpx.AsyncClient(base_url=base_url.rsplit("/api", 1)[0], timeout=args.timeout) as client:
+                missing = await uncovered_routes(client, all_scenarios)
+            if missing:
+                print("Not covered: " + ", ".join(missing))
+    finally:
+        if uvicorn_server is not None:
+            uvicorn_server.should_exit = True
+            await task
+
+    if args.json:
+        Path(args.json).write_text(json.dumps([
+            {
+                "endpoint": r["name"],
+                "requests": len(r["samples"]),
+                "errors": r["errors"] + r["setup_errors"],
+                "p50_ms": percentile(r["samples"], 50) * 1000,
+                "p95_ms": percentile(r["samples"], 95) * 1000,
+                "p99_ms": percentile(r["samples"], 99) * 1000,
+                "rps": len(r["samples"]) / r["elapsed"] if r["elapsed"] else 0.0,
+            }
+            for r in results
+        ], indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001/api")
+    parser.add_argument("--in-memory", action="store_true", help="serve the backend in-process on mongomock-motor")
+    parser.add_argument("--port", type=int, default=8765, help="port for --in-memory")
+    parser.add_argument("--scale", choices=["tiny", "small", "semester"], default="semester")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--only", help="regex over 'METHOD /route' selecting endpoints")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="print the last error of each endpoint")
+    asyncio.run(main(parser.parse_args()))
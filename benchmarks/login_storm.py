@@ -0,0 +1,101 @@
+"""Login storm benchmark.
+
+Fires a burst of concurrent logins at the API while probing a cheap,
+unauthenticated endpoint, and compares the probe latency against a quiet
+baseline. When password hashing blocks the event loop the probe latency
+follows bcrypt; with hashing on the worker pool it should stay flat.
+
+Usage:
+    python benchmarks/login_storm.py --base-url http://localhost:8001/api \
+        --email student@university.com --password student123 \
+        --logins 300 --concurrency 100
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summary(label, samples):
+    return (
+        f"{label:<18} n={len(samples):<5} "
+        f"p50={percentile(samples, 50) * 1000:8.1f}ms "
+        f"p95={percentile(samples, 95) * 1000:8.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.1f}ms "
+        f"max={max(samples, default=0) * 1000:8.1f}ms"
+    )
+
+
+async def probe(client, stop, samples, interval):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/")
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+
+async def login(client, semaphore, credentials, samples, statuses):
+    async with semaphore:
+        started = time.perf_counter()
+        response = await client.post("/auth/login", json=credentials)
+        samples.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def main(args):
+    credentials = {"email": args.email, "password": args.password}
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as auth_client, \
+            httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as probe_client:
+        # Quiet baseline
+        baseline = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(probe_client, stop, baseline, args.probe_interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        await task
+
+        # Login storm with the probe running alongside
+        during = []
+        login_samples = []
+        statuses = {}
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(probe_client, stop, during, args.probe_interval))
+        semaphore = asyncio.Semaphore(args.concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            login(auth_client, semaphore, credentials, login_samples, statuses)
+            for _ in range(args.logins)
+        ))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await task
+
+    print(f"{args.logins} logins in {elapsed:.2f}s ({args.logins / elapsed:.1f} logins/s), statuses {statuses}")
+    print(summary("login", login_samples))
+    print(summary("probe (baseline)", baseline))
+    print(summary("probe (storm)", during))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001/api")
+    parser.add_argument("--email", default="student@university.com")
+    parser.add_argument("--password", default="student123")
+    parser.add_argument("--logins", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    asyncio.run(main(parser.parse_args()))
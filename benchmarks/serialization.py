@@ -0,0 +1,165 @@
+"""Serialization benchmark.
+
+Encodes a 1000-row /api/grades response (each row enriched with its course
+and student) and a 1000-row /api/admin/users response two ways, and reports
+CPU time per response and payload size:
+
+* legacy: whole documents with ``_id``, ``convert_objectid_to_str``,
+  ``UserResponse(**...)`` per user, FastAPI's ``jsonable_encoder`` and the
+  stdlib ``json`` renderer
+* fast: documents as read with the response-shape projections, trusted
+  rows and the orjson ``FastJSONResponse``
+
+Runs offline against synthetic documents; no database is needed.
+
+Usage:
+    python benchmarks/serialization.py --rows 1000 --repeat 20
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import server  # noqa: E402
+
+PASSWORD_HASH = "$2b$12$" + "x" * 53
+
+
+def user_doc(index, role):
+    return {
+        "_id": ObjectId(),
+        "id": str(uuid.uuid4()),
+        "email": f"{role}{index}@university.com",
+        "password": PASSWORD_HASH,
+        "first_name": f"First{index}",
+        "last_name": f"Last{index}",
+        "role": role,
+        "student_id": f"S{index:06d}" if role == "student" else None,
+        "department": "Computer Science",
+        "year": 2,
+        "status": "active",
+        "specialty": None,
+        "level": "L2" if role == "student" else None,
+        "field_of_study": "Informatique",
+        "phone": "+000 000 000",
+        "address": f"{index} University Street",
+        "created_at": datetime(2025, 1, 1) + timedelta(minutes=index),
+        "search_keys": ["fir", "firs", "first", "las", "last"],
+    }
+
+
+def course_doc(index, teacher):
+    return {
+        "_id": ObjectId(),
+        "id": str(uuid.uuid4()),
+        "name": f"Course {index}",
+        "code": f"CS{index:03d}",
+        "description": "An introduction to the subject, its methods and its main results.",
+        "teacher_id": teacher["id"],
+        "department": "Computer Science",
+        "credits": 6,
+        "semester": "S1",
+        "year": 2025,
+        "created_at": datetime(2025, 1, 1),
+        "search_keys": ["cou", "cour", "course"],
+    }
+
+
+def grade_doc(index, student, course):
+    return {
+        "_id": ObjectId(),
+        "id": str(uuid.uuid4()),
+        "student_id": student["id"],
+        "course_id": course["id"],
+        "exam_type": "final",
+        "score": float(index % 21),
+        "max_score": 20.0,
+        "exam_date": datetime(2025, 1, 10),
+        "created_at": datetime(2025, 1, 11) + timedelta(seconds=index),
+    }
+
+
+def project(doc, projection):
+    """What Mongo returns for an inclusion projection without ``_id``"""
+    return {field: doc[field] for field in projection if field != "_id" and field in doc}
+
+
+def build(rows):
+    teachers = [user_doc(i, "teacher") for i in range(20)]
+    students = [user_doc(i, "student") for i in range(rows)]
+    courses = [course_doc(i, teachers[i % len(teachers)]) for i in range(50)]
+    grades = [grade_doc(i, students[i], courses[i % len(courses)]) for i in range(rows)]
+    return students, courses, grades
+
+
+def legacy_grades(grades, courses, students):
+    by_course = {c["id"]: c for c in courses}
+    by_student = {s["id"]: s for s in students}
+    rows = [dict(grade) for grade in grades]
+    for row in rows:
+        server.convert_objectid_to_str(row)
+        row["course"] = server.convert_objectid_to_str(dict(by_course[row["course_id"]]))
+        row["student"] = server.convert_objectid_to_str(dict(by_student[row["student_id"]]))
+    return JSONResponse(jsonable_encoder(rows)).body
+
+
+def fast_grades(grades, courses, students):
+    by_course = {c["id"]: project(c, server.COURSE_PROJECTION) for c in courses}
+    by_student = {s["id"]: project(s, server.USER_RESPONSE_PROJECTION) for s in students}
+    rows = [project(grade, server.GRADE_PROJECTION) for grade in grades]
+    for row in rows:
+        row["course"] = by_course[row["course_id"]]
+        row["student"] = by_student[row["student_id"]]
+    return server.json_response(rows).body
+
+
+def legacy_users(students):
+    users = [dict(user) for user in students]
+    models = [server.UserResponse(**server.convert_objectid_to_str(user)) for user in users]
+    return JSONResponse(jsonable_encoder(models)).body
+
+
+def fast_users(students):
+    users = [project(user, server.USER_RESPONSE_PROJECTION) for user in students]
+    return server.json_response(server.trusted_users(users)).body
+
+
+def measure(label, func, repeat):
+    body = func()
+    started = time.process_time()
+    for _ in range(repeat):
+        func()
+    per_call = (time.process_time() - started) / repeat
+    print(f"{label:<16} {per_call * 1000:8.2f} ms CPU/response {len(body) / 1024:9.1f} KiB")
+    return per_call, len(body)
+
+
+def main(args):
+    students, courses, grades = build(args.rows)
+    print(f"{args.rows} rows per response, {args.repeat} repetitions")
+    for name, legacy, fast in (
+        ("grades", lambda: legacy_grades(grades, courses, students), lambda: fast_grades(grades, courses, students)),
+        ("users", lambda: legacy_users(students), lambda: fast_users(students)),
+    ):
+        old_time, old_size = measure(f"{name} legacy", legacy, args.repeat)
+        new_time, new_size = measure(f"{name} fast", fast, args.repeat)
+        print(f"{name:<16} {old_time / new_time:8.1f}x faster {100 * (1 - new_size / old_size):8.1f}% smaller")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
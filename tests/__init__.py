@@ -0,0 +1,20 @@
+"""Unit tests for the backend's pure functions; they need no running server or database."""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# server builds its (lazily connecting) Mongo client at import time
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "unit_tests")
+
+import server  # noqa: E402
+
+
+def entry(entry_id, day, start, end, classroom="A1", teacher_id="t1"):
+    """A schedule document as the API stores it"""
+    return {
+        "id": entry_id, "day_of_week": day, "classroom": classroom, "teacher_id": teacher_id,
+        **server.schedule_slot(start, end),
+    }
@@ -0,0 +1,73 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import bson
+
+import server
+
+DAY_MS = 24 * 3600 * 1000
+
+
+def evaluate(expression, document):
+    """Evaluate the aggregation operators rollup_period_start_expression uses, with Mongo's UTC semantics"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return document[expression[1:]]
+    if not isinstance(expression, dict):
+        return expression
+    (operator, argument), = expression.items()
+    if operator == "$dateFromParts":
+        return datetime(*(evaluate(argument[part], document) for part in ("year", "month", "day")))
+    if operator in ("$year", "$month", "$dayOfMonth"):
+        date = evaluate(argument, document)
+        return {"$year": date.year, "$month": date.month, "$dayOfMonth": date.day}[operator]
+    if operator == "$dayOfWeek":
+        return evaluate(argument, document).isoweekday() % 7 + 1
+    values = [evaluate(value, document) for value in argument]
+    if operator == "$add":
+        return sum(values)
+    if operator == "$multiply":
+        return values[0] * values[1]
+    if operator == "$mod":
+        return values[0] % values[1]
+    if operator == "$subtract":
+        return values[0] - timedelta(milliseconds=values[1])
+    raise NotImplementedError(operator)
+
+
+def stored(row):
+    """The row as Mongo keeps it: BSON dates are UTC and read back naive"""
+    return bson.decode(bson.encode(row))
+
+
+class RollupBucketingTest(unittest.TestCase):
+    def rebuilt_counts(self, rows):
+        counts = {}
+        for row in map(stored, rows):
+            for period in server.ROLLUP_PERIODS:
+                key = (row["course_id"], period, evaluate(server.rollup_period_start_expression(period), row))
+                bucket = counts.setdefault(key, {"present": 0, "absent": 0, "total": 0})
+                bucket["total"] += 1
+                bucket[row["status"]] += 1
+        return counts
+
+    def test_offset_dates_bucket_by_utc_day_like_the_rebuild(self):
+        plus_two, minus_five = timezone(timedelta(hours=2)), timezone(timedelta(hours=-5))
+        rows = [
+            {"course_id": "c1", "date": datetime(2025, 3, 10, 0, 30, tzinfo=plus_two), "status": "present"},
+            {"course_id": "c1", "date": datetime(2025, 3, 9, 21, 0, tzinfo=minus_five), "status": "absent"},
+            {"course_id": "c1", "date": datetime(2025, 3, 10, 12, 0), "status": "present"},
+        ]
+        counts = server.rollup_counts(rows)
+        self.assertEqual(counts, self.rebuilt_counts(rows))
+        # 00:30+02:00 on Monday the 10th is Sunday the 9th in UTC, so it falls in the previous week
+        self.assertEqual(counts[("c1", "day", datetime(2025, 3, 9))]["present"], 1)
+        self.assertEqual(counts[("c1", "day", datetime(2025, 3, 10))], {"present": 1, "absent": 1, "total": 2})
+        self.assertEqual(counts[("c1", "week", datetime(2025, 3, 3))]["total"], 1)
+        self.assertEqual(counts[("c1", "week", datetime(2025, 3, 10))]["total"], 2)
+
+    def test_week_starts_on_monday_for_every_weekday(self):
+        rows = [
+            {"course_id": "c1", "date": datetime(2025, 9, 1, 23, 59) + timedelta(days=offset), "status": "present"}
+            for offset in range(14)
+        ]
+        self.assertEqual(server.rollup_counts(rows), self.rebuilt_counts(rows))
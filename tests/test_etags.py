@@ -0,0 +1,37 @@
+import unittest
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+import server
+
+
+def request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/api/courses", "query_string": b"", "headers": headers})
+
+
+class NotModifiedTest(unittest.TestCase):
+    ETAG = '"0123456789abcdef"'
+
+    def test_tags_a_fresh_response(self):
+        response = Response()
+        self.assertIsNone(server.not_modified(request(), response, self.ETAG))
+        self.assertEqual(response.headers["etag"], self.ETAG)
+        self.assertEqual(response.headers["cache-control"], "private, no-cache")
+
+    def test_matching_tag_is_not_modified(self):
+        for sent in [self.ETAG, f'"other", {self.ETAG}', f"W/{self.ETAG}", "*"]:
+            answer = server.not_modified(request(sent), Response(), self.ETAG)
+            self.assertEqual(answer.status_code, 304, sent)
+            self.assertEqual(answer.headers["etag"], self.ETAG)
+
+    def test_compressed_tags_round_trip(self):
+        for coding in server.CONTENT_CODINGS:
+            sent = f'{self.ETAG[:-1]}-{coding}"'
+            self.assertEqual(server._opaque_tag(sent), self.ETAG)
+            self.assertEqual(server.not_modified(request(sent), Response(), self.ETAG).status_code, 304)
+
+    def test_other_tag_is_served(self):
+        self.assertIsNone(server.not_modified(request('"stale"'), Response(), self.ETAG))
+
@@ -0,0 +1,36 @@
+import unittest
+from datetime import datetime, timedelta
+
+import server
+
+
+def exam(exam_id, start, minutes, *keys):
+    return {
+        "id": exam_id, "proposed_date": start, "ends_at": start + timedelta(minutes=minutes),
+        "clash_keys": list(keys),
+    }
+
+
+class ExamIntervalIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.start = datetime(2026, 1, 5, 9)
+        self.index = server.ExamIntervalIndex()
+        self.index.add(exam("morning", self.start, 120, "teacher:t1", "room:A1"))
+        self.index.add(exam("long", self.start - timedelta(hours=6), 7 * 60, "cohort:CS|L1"))
+
+    def test_overlap_on_shared_key(self):
+        clashes = self.index.clashes(exam("new", self.start + timedelta(hours=1), 60, "room:A1", "teacher:t2"))
+        self.assertEqual([(clash["id"], clash["clash_on"]) for clash in clashes], [("morning", ["room"])])
+
+    def test_back_to_back_and_other_keys_do_not_clash(self):
+        self.assertEqual(self.index.clashes(exam("after", self.start + timedelta(hours=2), 60, "teacher:t1")), [])
+        self.assertEqual(self.index.clashes(exam("before", self.start - timedelta(hours=1), 60, "teacher:t1")), [])
+        self.assertEqual(self.index.clashes(exam("other", self.start, 60, "teacher:t2")), [])
+
+    def test_long_exam_started_earlier(self):
+        clashes = self.index.clashes(exam("new", self.start, 30, "cohort:CS|L1"))
+        self.assertEqual([clash["id"] for clash in clashes], ["long"])
+
+    def test_ignores_itself(self):
+        self.assertEqual(self.index.clashes(exam("morning", self.start, 120, "teacher:t1")), [])
+
@@ -0,0 +1,30 @@
+import unittest
+
+import server
+
+
+class ComputeGradeStatsTest(unittest.TestCase):
+    def test_empty(self):
+        stats = server.compute_grade_stats([])
+        self.assertEqual(stats["count"], 0)
+        self.assertIsNone(stats["mean"])
+        self.assertEqual(stats["percentiles"], {})
+        self.assertEqual(sum(bucket["count"] for bucket in stats["histogram"]), 0)
+
+    def test_summary_and_interpolated_percentiles(self):
+        stats = server.compute_grade_stats([4, 8, 12, 16, 20])
+        self.assertEqual(stats["count"], 5)
+        self.assertEqual(stats["mean"], 12.0)
+        self.assertEqual(stats["median"], 12.0)
+        self.assertEqual(stats["std_dev"], 5.66)
+        self.assertEqual((stats["min"], stats["max"]), (4, 20))
+        self.assertEqual(stats["pass_rate"], 0.6)
+        self.assertEqual(stats["percentiles"], {"p10": 5.6, "p25": 8.0, "p50": 12.0, "p75": 16.0, "p90": 18.4})
+
+    def test_histogram_bins(self):
+        stats = server.compute_grade_stats([0, 1.99, 2, 19.5, 20])
+        histogram = stats["histogram"]
+        self.assertEqual(len(histogram), server.HISTOGRAM_BINS)
+        self.assertEqual((histogram[0]["from"], histogram[-1]["to"]), (0, server.GRADE_SCALE))
+        self.assertEqual([bucket["count"] for bucket in histogram], [2, 1, 0, 0, 0, 0, 0, 0, 0, 2])
+
@@ -0,0 +1,59 @@
+import unittest
+from itertools import combinations
+
+from fastapi import HTTPException
+
+import server
+from tests import entry
+
+
+class ScheduleSlotTest(unittest.TestCase):
+    def test_minutes_since_midnight(self):
+        self.assertEqual(server.schedule_slot("08:00", "09:30"), {"start_minute": 480, "end_minute": 570})
+
+    def test_rejects_bad_times(self):
+        for start, end in [("8h", "09:00"), ("25:00", "26:00"), ("10:00", "10:00"), ("11:00", "10:00")]:
+            with self.assertRaises(HTTPException) as caught:
+                server.schedule_slot(start, end)
+            self.assertEqual(caught.exception.status_code, 400)
+
+
+class SweepOverlapsTest(unittest.TestCase):
+    def pairs(self, overlaps):
+        return {frozenset((overlap["first"]["id"], overlap["second"]["id"])) for overlap in overlaps}
+
+    def test_finds_overlapping_pairs_only(self):
+        entries = [
+            entry("a", "Monday", "08:00", "10:00"),
+            entry("b", "Monday", "09:00", "11:00"),
+            entry("c", "Monday", "10:00", "12:00"),  # touches a, overlaps b
+            entry("d", "Tuesday", "08:00", "10:00"),  # other day
+        ]
+        overlaps = server.sweep_overlaps(entries, "teacher_id")
+        self.assertEqual(self.pairs(overlaps), {frozenset("ab"), frozenset("bc")})
+        self.assertTrue(all(overlap["teacher_id"] == "t1" for overlap in overlaps))
+
+    def test_groups_by_field(self):
+        entries = [
+            entry("a", "Monday", "08:00", "10:00", classroom="A1", teacher_id="t1"),
+            entry("b", "Monday", "08:00", "10:00", classroom="A2", teacher_id="t2"),
+            entry("c", "Monday", "09:00", "10:00", classroom="A1", teacher_id=None),
+        ]
+        self.assertEqual(self.pairs(server.sweep_overlaps(entries, "classroom")), {frozenset("ac")})
+        self.assertEqual(server.sweep_overlaps(entries, "teacher_id"), [])
+
+    def test_matches_brute_force(self):
+        starts = ["08:00", "08:30", "09:00", "09:45", "10:15", "11:00"]
+        entries = [
+            entry(str(i), "Monday", starts[i % len(starts)], f"{9 + i % 4:02d}:{(i * 7) % 60:02d}", classroom=f"R{i % 2}")
+            for i in range(24)
+            if server.parse_clock(starts[i % len(starts)]) < server.parse_clock(f"{9 + i % 4:02d}:{(i * 7) % 60:02d}")
+        ]
+        expected = {
+            frozenset((first["id"], second["id"]))
+            for first, second in combinations(entries, 2)
+            if first["classroom"] == second["classroom"]
+            and first["start_minute"] < second["end_minute"] and second["start_minute"] < first["end_minute"]
+        }
+        self.assertEqual(self.pairs(server.sweep_overlaps(entries, "classroom")), expected)
+
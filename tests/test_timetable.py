@@ -0,0 +1,52 @@
+import unittest
+
+import server
+from tests import entry
+
+
+class TimetableSolverTest(unittest.TestCase):
+    DAYS = ["Monday", "Tuesday"]
+    SLOTS = [
+        {"start_time": start, "end_time": end, **server.schedule_slot(start, end)}
+        for start, end in [("08:00", "09:30"), ("09:40", "11:10"), ("11:20", "12:50")]
+    ]
+
+    def courses(self, count, teachers):
+        return [{"id": f"c{i}", "code": f"C{i}", "teacher_id": f"t{i % teachers}"} for i in range(count)]
+
+    def assert_no_double_booking(self, entries):
+        for field in ("classroom", "teacher_id"):
+            self.assertEqual(server.sweep_overlaps([dict(e, id=str(i)) for i, e in enumerate(entries)], field), [])
+
+    def test_places_every_session_without_double_booking(self):
+        solver = server.TimetableSolver(self.courses(10, 4), ["A1", "A2"], self.DAYS, self.SLOTS, 1, seed=1)
+        report = solver.solve(1.0)
+        self.assertEqual(report["sessions_scheduled"], 10)
+        self.assertEqual(report["unscheduled"], [])
+        self.assert_no_double_booking(solver.schedules())
+
+    def test_reports_sessions_it_cannot_place(self):
+        # One room, six periods, eight sessions
+        solver = server.TimetableSolver(self.courses(8, 8), ["A1"], self.DAYS, self.SLOTS, 1, seed=1)
+        report = solver.solve(0.5)
+        self.assertEqual(report["sessions_scheduled"], 6)
+        self.assertEqual(len(report["unscheduled"]), 2)
+        self.assertTrue(all(row["reason"] == "No free classroom" for row in report["unscheduled"]))
+        self.assert_no_double_booking(solver.schedules())
+
+    def test_busy_teacher_is_reported(self):
+        # One teacher, seven sessions, six periods
+        solver = server.TimetableSolver(self.courses(7, 1), ["A1", "A2"], self.DAYS, self.SLOTS, 1, seed=1)
+        report = solver.solve(0.5)
+        self.assertEqual(report["sessions_scheduled"], 6)
+        self.assertEqual([row["reason"] for row in report["unscheduled"]], ["Teacher has no free period"])
+        self.assert_no_double_booking(solver.schedules())
+
+    def test_respects_existing_entries(self):
+        solver = server.TimetableSolver(self.courses(5, 5), ["A1"], self.DAYS, self.SLOTS, 1, seed=1)
+        existing = entry("x", "Monday", "08:00", "12:50", classroom="A1", teacher_id="other")
+        solver.block(existing)
+        report = solver.solve(0.5)
+        self.assertEqual(report["sessions_scheduled"], 3)
+        self.assert_no_double_booking(solver.schedules() + [existing])
+
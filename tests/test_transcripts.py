@@ -0,0 +1,61 @@
+import unittest
+
+import server
+
+
+def grade(course_id, exam_type, score, max_score=20):
+    return {"student_id": "s1", "course_id": course_id, "exam_type": exam_type, "score": score, "max_score": max_score}
+
+
+COURSES = {
+    "algebra": {"id": "algebra", "code": "MA101", "name": "Algebra", "credits": 6, "year": 2025, "semester": "S1"},
+    "physics": {"id": "physics", "code": "PH101", "name": "Physics", "credits": 2, "year": 2025, "semester": "S1"},
+    "analysis": {"id": "analysis", "code": "MA201", "name": "Analysis", "credits": 4, "year": 2025, "semester": "S2"},
+}
+
+
+class BuildTranscriptTest(unittest.TestCase):
+    def rows(self, transcript):
+        return {row["course_id"]: row for row in transcript["courses"]}
+
+    def test_weights_continuous_and_final(self):
+        transcript = server.build_transcript("s1", [
+            grade("algebra", "continuous", 10),
+            grade("algebra", "continuous", 14),
+            grade("algebra", "final", 15),
+        ], COURSES)
+        row = self.rows(transcript)["algebra"]
+        self.assertEqual(row["continuous_average"], 12.0)
+        self.assertEqual(row["final_average"], 15.0)
+        self.assertEqual(row["average"], 13.8)  # 0.4 * 12 + 0.6 * 15
+        self.assertEqual(row["grade_count"], 3)
+        self.assertTrue(row["passed"])
+
+    def test_normalizes_by_max_score_and_renormalizes_single_type(self):
+        transcript = server.build_transcript("s1", [grade("physics", "final", 40, max_score=100)], COURSES)
+        row = self.rows(transcript)["physics"]
+        self.assertIsNone(row["continuous_average"])
+        self.assertEqual(row["average"], 8.0)
+        self.assertFalse(row["passed"])
+
+    def test_credit_weighted_gpas(self):
+        transcript = server.build_transcript("s1", [
+            grade("algebra", "final", 14),   # 6 credits, passed
+            grade("physics", "final", 6),    # 2 credits, failed
+            grade("analysis", "final", 12),  # 4 credits, next semester
+        ], COURSES)
+        self.assertEqual(
+            [(s["semester"], s["gpa"], s["credits_attempted"], s["credits_earned"]) for s in transcript["semesters"]],
+            [("S1", 12.0, 8, 6), ("S2", 12.0, 4, 4)],
+        )
+        self.assertEqual(transcript["cumulative"], {"gpa": 12.0, "credits_attempted": 12, "credits_earned": 10})
+        self.assertEqual([row["code"] for row in transcript["courses"]], ["MA101", "PH101", "MA201"])
+
+    def test_skips_unknown_courses_and_zero_max_scores(self):
+        transcript = server.build_transcript("s1", [
+            grade("deleted", "final", 10),
+            grade("algebra", "final", 10, max_score=0),
+        ], COURSES)
+        self.assertEqual(transcript["courses"], [])
+        self.assertEqual(transcript["cumulative"], {"gpa": None, "credits_attempted": 0, "credits_earned": 0})
+